@@ -36,4 +36,16 @@ public class PythonGenerationRequest
     
     [JsonPropertyName("input_image")]
     public string? InputImage { get; set; }
+    
+    [JsonPropertyName("deadline_seconds")]
+    public double? DeadlineSeconds { get; set; }
+    
+    [JsonPropertyName("draft")]
+    public bool Draft { get; set; }
+    
+    [JsonPropertyName("refine_from")]
+    public string? RefineFrom { get; set; }
+    
+    [JsonPropertyName("refine_strength")]
+    public double? RefineStrength { get; set; }
 } 
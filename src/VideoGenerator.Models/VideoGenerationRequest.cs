@@ -30,4 +30,17 @@ public class VideoGenerationRequest
     public string OutputDirectory { get; set; } = string.Empty;
     
     public string? InputImagePath { get; set; }
+
+    // Optional wall-clock budget; the generator reduces steps/resolution to finish within it
+    [Range(1, 86400)]
+    public double? DeadlineSeconds { get; set; }
+
+    // Draft renders a reduced-resolution, few-step preview and saves its latents next to the video
+    public bool Draft { get; set; }
+
+    // Path to draft latents (*.latents.pt) to refine at full resolution instead of rendering from scratch
+    public string? RefineFromLatentsPath { get; set; }
+
+    [Range(0.05, 1.0)]
+    public double? RefineStrength { get; set; }
 } 
\ No newline at end of file
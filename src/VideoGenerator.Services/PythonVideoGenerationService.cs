@@ -88,7 +88,11 @@ public class PythonVideoGenerationService : IVideoGenerationService, IDisposable
                 Width = request.Width,
                 Height = request.Height,
                 Fps = request.Fps,
-                InputImage = request.InputImagePath
+                InputImage = request.InputImagePath,
+                DeadlineSeconds = request.DeadlineSeconds,
+                Draft = request.Draft,
+                RefineFrom = request.RefineFromLatentsPath,
+                RefineStrength = request.RefineStrength
             };
             
             var hasInputImage = !string.IsNullOrEmpty(request.InputImagePath);
@@ -6,8 +6,15 @@ Generates videos using the LTX Video model from Lightricks.
 
 import sys
 import json
+import math
 import os
+import platform
+import struct
+import time
 import argparse
+import contextlib
+import functools
+import inspect
 from pathlib import Path
 
 def check_dependencies():
@@ -43,8 +50,968 @@ def load_request(request_path):
         print(f"Error loading request file: {e}", file=sys.stderr)
         return None
 
+# Files that identify a non-weight component (tokenizer, scheduler, ...) as present
+COMPONENT_CONFIG_FILES = (
+    "config.json",
+    "scheduler_config.json",
+    "tokenizer_config.json",
+    "preprocessor_config.json",
+)
+TOKENIZER_MODEL_FILES = ("spiece.model", "tokenizer.json")
+WEIGHT_FILE_EXTENSIONS = (".safetensors", ".bin")
+VALIDATION_CACHE_FILE = "model_validation_cache.json"
+
+def get_cache_dir():
+    """Return the per-host directory used for cached verdicts and measurements."""
+    cache_dir = os.environ.get("LTX_VIDEO_CACHE_DIR")
+    if not cache_dir:
+        base_dir = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+        cache_dir = os.path.join(base_dir, "ltx_video_generator")
+    return cache_dir
+
+def load_cache_file(file_name):
+    """Load a JSON cache file from the cache directory, returning {} if absent or unreadable."""
+    cache_path = os.path.join(get_cache_dir(), file_name)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_cache_file(file_name, data):
+    """Write a JSON cache file to the cache directory. Failures are reported but not fatal."""
+    cache_dir = get_cache_dir()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_path = os.path.join(cache_dir, file_name)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"WARNING: Could not write cache file {file_name}: {e}", file=sys.stderr)
+
+def get_model_components(model_index):
+    """Return the component names listed in model_index.json that should exist on disk."""
+    components = []
+    for name, value in model_index.items():
+        if name.startswith('_'):
+            continue
+        # Components are recorded as [library, class]; [null, null] marks an optional, absent component
+        if isinstance(value, list) and len(value) == 2 and value[1] is not None:
+            components.append(name)
+    return sorted(components)
+
+def compute_model_fingerprint(model_dir, components):
+    """Build a fingerprint of the files the validator inspects from their sizes and mtimes."""
+    entries = []
+    paths = [os.path.join(model_dir, "model_index.json")]
+    for component in components:
+        component_dir = os.path.join(model_dir, component)
+        if os.path.isdir(component_dir):
+            paths.extend(os.path.join(component_dir, name) for name in sorted(os.listdir(component_dir)))
+        else:
+            paths.append(component_dir)
+    for path in paths:
+        relative_path = os.path.relpath(path, model_dir).replace(os.sep, '/')
+        try:
+            stat = os.stat(path)
+            entries.append([relative_path, stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            entries.append([relative_path, None, None])
+    return entries
+
+def check_safetensors_file(file_path):
+    """Check that a .safetensors file is complete by comparing its header against its size."""
+    try:
+        file_size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            header_bytes = f.read(8)
+            if len(header_bytes) < 8:
+                return f"{file_path} is truncated (no safetensors header)"
+            (header_length,) = struct.unpack('<Q', header_bytes)
+            if 8 + header_length > file_size:
+                return f"{file_path} is truncated (header extends past end of file)"
+            header = json.loads(f.read(header_length))
+    except (OSError, ValueError) as e:
+        return f"{file_path} could not be read as safetensors: {e}"
+
+    data_end = 0
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        offsets = info.get("data_offsets") if isinstance(info, dict) else None
+        if offsets and len(offsets) == 2:
+            data_end = max(data_end, offsets[1])
+
+    expected_size = 8 + header_length + data_end
+    if file_size < expected_size:
+        return f"{file_path} is truncated ({file_size} of {expected_size} bytes present)"
+    return None
+
+def check_weight_file(file_path):
+    """Check that a single weight file exists and is complete."""
+    if not os.path.isfile(file_path):
+        return f"Missing weight file: {file_path}"
+    if os.path.getsize(file_path) == 0:
+        return f"Weight file is empty: {file_path}"
+    if file_path.endswith('.safetensors'):
+        return check_safetensors_file(file_path)
+    return None
+
+def validate_component(model_dir, component):
+    """Validate one component directory listed in model_index.json. Returns a list of problems."""
+    component_dir = os.path.join(model_dir, component)
+    if not os.path.isdir(component_dir):
+        return [f"Missing component directory: {component}/"]
+
+    file_names = os.listdir(component_dir)
+    config_files = [name for name in COMPONENT_CONFIG_FILES if name in file_names]
+    if not config_files:
+        return [f"Component {component}/ has no configuration file ({', '.join(COMPONENT_CONFIG_FILES)})"]
+
+    problems = []
+    for config_file in config_files:
+        try:
+            with open(os.path.join(component_dir, config_file), 'r', encoding='utf-8') as f:
+                json.load(f)
+        except (OSError, ValueError) as e:
+            problems.append(f"Component {component}/{config_file} is not valid JSON: {e}")
+
+    if "tokenizer_config.json" in config_files and not any(name in file_names for name in TOKENIZER_MODEL_FILES):
+        problems.append(f"Component {component}/ is missing tokenizer files ({', '.join(TOKENIZER_MODEL_FILES)})")
+
+    # Only model components (those with config.json) carry weights
+    if "config.json" not in config_files:
+        return problems
+
+    # Check only the weights the loader would use: it prefers safetensors (sharded, then single
+    # file) over .bin, so leftover .bin files or indexes next to safetensors weights are ignored
+    safetensors_indexes = sorted(name for name in file_names if name.endswith('.safetensors.index.json'))
+    safetensors_files = sorted(name for name in file_names if name.endswith('.safetensors'))
+    other_indexes = sorted(name for name in file_names
+                           if name.endswith('.index.json') and name not in safetensors_indexes)
+    if safetensors_indexes or (other_indexes and not safetensors_files):
+        # Sharded checkpoint: every shard referenced by the weight map must be present and complete
+        for index_file in safetensors_indexes or other_indexes:
+            try:
+                with open(os.path.join(component_dir, index_file), 'r', encoding='utf-8') as f:
+                    weight_map = json.load(f).get("weight_map", {})
+            except (OSError, ValueError) as e:
+                problems.append(f"Component {component}/{index_file} is not valid JSON: {e}")
+                continue
+            for shard in sorted(set(weight_map.values())):
+                problem = check_weight_file(os.path.join(component_dir, shard))
+                if problem:
+                    problems.append(problem)
+        return problems
+
+    weight_files = safetensors_files or sorted(name for name in file_names if name.endswith(WEIGHT_FILE_EXTENSIONS))
+    if not weight_files:
+        problems.append(f"Component {component}/ has no weight files (*.safetensors or *.bin)")
+    for weight_file in weight_files:
+        problem = check_weight_file(os.path.join(component_dir, weight_file))
+        if problem:
+            problems.append(problem)
+    return problems
+
+def validate_model_directory(model_dir, use_cache=True):
+    """
+    Validate a diffusers model directory without loading any weights.
+
+    Reads model_index.json and each component's configuration, and checks that every
+    weight file is present and complete. The verdict is cached per directory, keyed by
+    the sizes and mtimes of the inspected files, so repeat checks only need to stat them.
+
+    Returns a dict with 'valid' (bool), 'problems' (list of str) and 'cached' (bool).
+    """
+    model_dir = os.path.abspath(model_dir)
+    model_index_path = os.path.join(model_dir, "model_index.json")
+
+    if not os.path.isdir(model_dir):
+        return {"valid": False, "problems": [f"Model directory not found: {model_dir}"], "cached": False}
+
+    try:
+        with open(model_index_path, 'r', encoding='utf-8') as f:
+            model_index = json.load(f)
+    except FileNotFoundError:
+        return {"valid": False, "problems": [f"Model directory missing model_index.json: {model_dir}"], "cached": False}
+    except (OSError, ValueError) as e:
+        return {"valid": False, "problems": [f"model_index.json could not be read: {e}"], "cached": False}
+
+    components = get_model_components(model_index)
+    fingerprint = compute_model_fingerprint(model_dir, components)
+
+    cache = load_cache_file(VALIDATION_CACHE_FILE) if use_cache else {}
+    cached_entry = cache.get(model_dir)
+    if cached_entry and cached_entry.get("fingerprint") == fingerprint:
+        problems = cached_entry.get("problems", [])
+        return {"valid": not problems, "problems": problems, "cached": True}
+
+    problems = []
+    for component in components:
+        problems.extend(validate_component(model_dir, component))
+
+    if use_cache:
+        cache[model_dir] = {"fingerprint": fingerprint, "problems": problems}
+        save_cache_file(VALIDATION_CACHE_FILE, cache)
+
+    return {"valid": not problems, "problems": problems, "cached": False}
+
+STEP_COSTS_FILE = "step_costs.json"
+MIN_DEADLINE_STEPS = 8
+MIN_DEADLINE_SIZE = 256
+MIN_DEADLINE_FPS = 8
+# Weight given to the newest measurement when updating the stored per-host step costs
+STEP_COST_SMOOTHING = 0.5
+# Steps measured before the controller may shorten the schedule (the first is warm-up)
+DEADLINE_MIN_MEASURED_STEPS = 2
+
+def get_host_key(device_name):
+    """Return the key under which per-host measurements are stored."""
+    return f"{platform.node()}/{device_name}"
+
+def get_latent_token_count(width, height, num_frames):
+    """Return the number of latent tokens the transformer processes per denoising step."""
+    # The LTX VAE compresses 32x spatially and 8x temporally (keeping the first frame)
+    return math.ceil(width / 32) * math.ceil(height / 32) * ((max(num_frames, 1) - 1) // 8 + 1)
+
+def get_guidance_batch_size(guidance_scale):
+    """Return how many transformer passes each step makes (classifier-free guidance doubles it)."""
+    return 2 if guidance_scale > 1.0 else 1
+
+def load_step_costs(host_key):
+    """Return the stored step cost model for this host, or None if none has been recorded."""
+    return load_cache_file(STEP_COSTS_FILE).get(host_key)
+
+def record_step_costs(host_key, step_seconds_per_token, overhead_seconds_per_token):
+    """Blend a new measurement into the stored step cost model for this host."""
+    costs = load_cache_file(STEP_COSTS_FILE)
+    previous = costs.get(host_key)
+    measured = {
+        "step_seconds_per_token": step_seconds_per_token,
+        "overhead_seconds_per_token": overhead_seconds_per_token,
+    }
+    if previous:
+        for key, value in measured.items():
+            if key in previous:
+                measured[key] = STEP_COST_SMOOTHING * value + (1 - STEP_COST_SMOOTHING) * previous[key]
+    measured["samples"] = (previous or {}).get("samples", 0) + 1
+    costs[host_key] = measured
+    save_cache_file(STEP_COSTS_FILE, costs)
+    return measured
+
+def predict_generation_seconds(params, cost_model):
+    """Predict denoising plus decode/save time for the given parameters."""
+    num_frames = params["duration_seconds"] * params["fps"]
+    tokens = get_latent_token_count(params["width"], params["height"], num_frames)
+    step_tokens = tokens * get_guidance_batch_size(params["guidance_scale"])
+    return (params["steps"] * cost_model["step_seconds_per_token"] * step_tokens
+            + cost_model.get("overhead_seconds_per_token", 0.0) * tokens)
+
+def plan_generation_for_deadline(params, budget_seconds, cost_model):
+    """
+    Reduce generation parameters until the predicted time fits the budget.
+
+    Steps are reduced first, then resolution (keeping multiples of 32), then fps (keeping the
+    duration). Returns the adjusted parameters and a list of human-readable adjustments.
+    """
+    planned = dict(params)
+    adjustments = []
+
+    predicted = predict_generation_seconds(planned, cost_model)
+    if predicted <= budget_seconds:
+        return planned, adjustments
+
+    # Steps: the per-step share of the prediction scales linearly with the step count
+    overhead = predict_generation_seconds(dict(planned, steps=0), cost_model)
+    per_step = (predicted - overhead) / planned["steps"]
+    affordable_steps = int((budget_seconds - overhead) // per_step) if per_step > 0 else planned["steps"]
+    steps = max(MIN_DEADLINE_STEPS, min(planned["steps"], affordable_steps))
+    if steps < planned["steps"]:
+        adjustments.append(f"steps {planned['steps']} -> {steps}")
+        planned["steps"] = steps
+        predicted = predict_generation_seconds(planned, cost_model)
+    if predicted <= budget_seconds:
+        return planned, adjustments
+
+    # Resolution: cost scales roughly with area, so shrink both sides by the square root of the
+    # overrun, using one factor to keep the aspect ratio and flooring the shorter side
+    short_side = min(planned["width"], planned["height"])
+    width, height = planned["width"], planned["height"]
+    if short_side > MIN_DEADLINE_SIZE:
+        scale = math.sqrt(max(budget_seconds, 0.0) / predicted)
+        new_short_side = max(MIN_DEADLINE_SIZE, int(short_side * scale) // 32 * 32)
+        scale = new_short_side / short_side
+        width = max(32, int(planned["width"] * scale) // 32 * 32)
+        height = max(32, int(planned["height"] * scale) // 32 * 32)
+    if width <= planned["width"] and height <= planned["height"] and width * height < planned["width"] * planned["height"]:
+        adjustments.append(f"resolution {planned['width']}x{planned['height']} -> {width}x{height}")
+        planned["width"], planned["height"] = width, height
+        predicted = predict_generation_seconds(planned, cost_model)
+    if predicted <= budget_seconds:
+        return planned, adjustments
+
+    # Frame count: lower the fps so the requested duration is kept
+    fps = max(MIN_DEADLINE_FPS, int(planned["fps"] * max(budget_seconds, 0.0) / predicted))
+    if fps < planned["fps"]:
+        adjustments.append(f"fps {planned['fps']} -> {fps}")
+        planned["fps"] = fps
+
+    return planned, adjustments
+
+def select_schedule_indices(start, end, count):
+    """Pick count evenly spaced schedule indices from [start, end), always including start."""
+    return [start + (index * (end - start)) // count for index in range(count)]
+
+class DeadlineController:
+    """
+    Step-end callback that keeps the denoising loop inside a wall-clock deadline.
+
+    After each step it projects the finish time from the measured step cost. If the remaining
+    schedule would overrun, the remaining timesteps/sigmas are resampled in place to fewer,
+    larger steps ending at the same terminal sigma, and the loop is interrupted once the
+    shortened schedule is complete.
+    """
+
+    def __init__(self, deadline_at, total_steps, total_steps_with_overhead, overhead_estimate=None,
+                 synchronize=None):
+        self.deadline_at = deadline_at
+        self.end_index = total_steps
+        self.total_steps_with_overhead = total_steps_with_overhead
+        self.overhead_estimate = overhead_estimate
+        self.step_times = []
+        self.last_time = time.monotonic()
+        self.adjustments = []
+        self.can_compress = True
+        # On CUDA the loop runs asynchronously, so wait for queued work before reading the clock
+        self.synchronize = synchronize
+
+    def mark_start(self):
+        """Reset the step clock just before the pipeline is called."""
+        if self.synchronize:
+            self.synchronize()
+        self.last_time = time.monotonic()
+
+    @property
+    def steps_completed(self):
+        return len(self.step_times)
+
+    def measured_step_seconds(self):
+        """Return the mean step time, excluding the first (warm-up) step once others exist."""
+        samples = self.step_times[1:] if len(self.step_times) > 1 else self.step_times
+        return sum(samples) / len(samples) if samples else None
+
+    def __call__(self, pipe, step_index, timestep, callback_kwargs):
+        if self.synchronize:
+            self.synchronize()
+        now = time.monotonic()
+        self.step_times.append(now - self.last_time)
+        self.last_time = now
+
+        print(f"STATUS: Denoising step {self.steps_completed}/{self.end_index}")
+        print(f"PROGRESS: Step {self.steps_completed + 3} of {self.total_steps_with_overhead}")
+        sys.stdout.flush()
+
+        next_index = step_index + 1
+        if next_index >= self.end_index:
+            # Shortened schedule finished; skip the (now unused) remaining timesteps
+            if next_index < len(pipe.scheduler.timesteps):
+                pipe._interrupt = True
+            return callback_kwargs
+
+        # The first sample also covers prompt encoding and latent setup, so wait for a real step time
+        if self.steps_completed < DEADLINE_MIN_MEASURED_STEPS:
+            return callback_kwargs
+
+        per_step = self.measured_step_seconds()
+        overhead = self.overhead_estimate if self.overhead_estimate is not None else 2 * per_step
+        budget = self.deadline_at - now - overhead
+        allowed = max(1, int(budget // per_step)) if per_step > 0 else self.end_index - next_index
+        if allowed < self.end_index - next_index and self.can_compress:
+            self.compress_schedule(pipe.scheduler, next_index, allowed)
+        return callback_kwargs
+
+    def compress_schedule(self, scheduler, start, count):
+        """Resample the remaining schedule [start, end_index) to count steps."""
+        sigmas = getattr(scheduler, "sigmas", None)
+        timesteps = getattr(scheduler, "timesteps", None)
+        if sigmas is None or timesteps is None or len(sigmas) != len(timesteps) + 1:
+            print(f"WARNING: {type(scheduler).__name__} does not support schedule compression; "
+                  "the deadline may be missed", file=sys.stderr)
+            self.can_compress = False
+            return
+
+        remaining = self.end_index - start
+        original_sigmas = sigmas.clone()
+        original_timesteps = timesteps.clone()
+        for offset, index in enumerate(select_schedule_indices(start, self.end_index, count)):
+            sigmas[start + offset] = original_sigmas[index]
+            timesteps[start + offset] = original_timesteps[index]
+        sigmas[start + count] = original_sigmas[self.end_index]
+        self.end_index = start + count
+
+        adjustment = f"remaining steps {remaining} -> {count} after step {start}"
+        self.adjustments.append(adjustment)
+        print(f"Deadline: {adjustment}")
+
+CALIBRATION_FILE = "calibration.json"
+# (width, height, num_frames) run during calibration; small enough to finish quickly on CPU
+CALIBRATION_CONFIGS = ((256, 256, 9), (384, 256, 17), (512, 384, 25))
+CALIBRATION_STEPS = 4
+CALIBRATION_PROMPT = "A calm lake at sunrise"
+
+def fit_linear(xs, ys):
+    """Least-squares fit of y = intercept + slope * x. Returns (intercept, slope)."""
+    count = len(xs)
+    if count == 0:
+        return 0.0, 0.0
+    mean_x = sum(xs) / count
+    mean_y = sum(ys) / count
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if variance == 0:
+        # A single distinct point: assume cost is proportional to x
+        return 0.0, (mean_y / mean_x if mean_x else 0.0)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+    return mean_y - slope * mean_x, slope
+
+def load_calibration(device_name=None):
+    """
+    Return this host's calibration, or None if it has not been calibrated.
+
+    With a device name, a calibration made on a different device is ignored.
+    """
+    calibration = load_cache_file(CALIBRATION_FILE).get(platform.node())
+    if calibration and device_name is not None and calibration.get("device") != device_name:
+        return None
+    return calibration
+
+def load_host_step_costs(device_name=None):
+    """
+    Return step costs recorded by deadline-mode jobs for a device on this host, or None.
+
+    Without a device name (--estimate avoids importing torch), the device stored with the
+    host calibration is used; costs recorded for other devices are never substituted.
+    """
+    if device_name is None:
+        calibration = load_calibration()
+        device_name = calibration.get("device") if calibration else None
+    if not device_name:
+        return None
+    return load_step_costs(get_host_key(device_name))
+
+def estimate_request(request, calibration=None, step_costs=None):
+    """
+    Predict wall time and peak memory for a request without running it.
+
+    Uses the host calibration when available, otherwise the step costs recorded by
+    deadline-mode jobs (which give no load time or memory). Returns None if neither exists.
+    """
+    return estimate_parameters(get_effective_parameters(request), calibration, step_costs)
+
+def estimate_parameters(parameters, calibration=None, step_costs=None):
+    """Predict wall time and peak memory for effective generation parameters (see estimate_request)."""
+    num_frames = parameters['duration_seconds'] * parameters['fps']
+    tokens = get_latent_token_count(parameters['width'], parameters['height'], num_frames)
+    step_tokens = tokens * get_guidance_batch_size(parameters['guidance_scale'])
+    steps = parameters['steps']
+
+    estimate = {
+        "latent_tokens": tokens,
+        "num_frames": num_frames,
+        "steps": steps,
+    }
+
+    if calibration:
+        step_seconds = calibration["step_intercept_seconds"] + calibration["step_seconds_per_token"] * step_tokens
+        overhead_seconds = calibration["overhead_intercept_seconds"] + calibration["overhead_seconds_per_token"] * tokens
+        load_seconds = calibration["load_seconds"]
+        peak_memory_bytes = None
+        if calibration.get("peak_memory_bytes_per_token") is not None:
+            peak_memory_bytes = int(calibration["peak_memory_intercept_bytes"]
+                                    + calibration["peak_memory_bytes_per_token"] * step_tokens)
+        estimate["source"] = "calibration"
+        estimate["device"] = calibration.get("device")
+    elif step_costs:
+        step_seconds = step_costs["step_seconds_per_token"] * step_tokens
+        overhead_seconds = step_costs.get("overhead_seconds_per_token", 0.0) * tokens
+        load_seconds = 0.0
+        peak_memory_bytes = None
+        estimate["source"] = "step_costs"
+    else:
+        return None
+
+    denoise_seconds = max(step_seconds, 0.0) * steps
+    overhead_seconds = max(overhead_seconds, 0.0)
+    estimate.update({
+        "load_seconds": round(load_seconds, 2),
+        "denoise_seconds": round(denoise_seconds, 2),
+        "overhead_seconds": round(overhead_seconds, 2),
+        "estimated_seconds": round(load_seconds + denoise_seconds + overhead_seconds, 2),
+        "peak_memory_bytes": peak_memory_bytes,
+    })
+    return estimate
+
+def calibrate(model_path):
+    """
+    Time a few small generations on this host and store a cost model fitted against
+    latent token count, for use by --estimate.
+    """
+    import torch
+    from diffusers import LTXPipeline
+
+    model_file, model_dir = resolve_model_path(model_path)
+
+    load_start = time.monotonic()
+    pipe = load_pipeline(LTXPipeline, model_file, model_dir)
+    use_cuda = torch.cuda.is_available()
+    if use_cuda:
+        pipe = pipe.to('cuda')
+        torch.cuda.synchronize()
+    load_seconds = time.monotonic() - load_start
+    device_name = torch.cuda.get_device_name() if use_cuda else "cpu"
+    print(f"Calibrating on {device_name}; model loaded in {load_seconds:.1f}s")
+
+    token_counts, step_seconds, overhead_seconds, peak_memory = [], [], [], []
+    for width, height, num_frames in CALIBRATION_CONFIGS:
+        step_times = []
+        last_time = [time.monotonic()]
+
+        def record_step(pipe, step_index, timestep, callback_kwargs):
+            if use_cuda:
+                torch.cuda.synchronize()
+            now = time.monotonic()
+            step_times.append(now - last_time[0])
+            last_time[0] = now
+            return callback_kwargs
+
+        if use_cuda:
+            torch.cuda.reset_peak_memory_stats()
+        run_start = time.monotonic()
+        last_time[0] = run_start
+        pipe(
+            prompt=CALIBRATION_PROMPT,
+            num_inference_steps=CALIBRATION_STEPS,
+            guidance_scale=1.0,  # a single transformer pass per step; guidance is scaled in at estimate time
+            width=width,
+            height=height,
+            num_frames=num_frames,
+            callback_on_step_end=record_step
+        )
+        run_seconds = time.monotonic() - run_start
+
+        # The first step also absorbs prompt encoding and latent preparation, so it counts as overhead
+        mean_step = sum(step_times[1:]) / len(step_times[1:])
+        tokens = get_latent_token_count(width, height, num_frames)
+        token_counts.append(tokens)
+        step_seconds.append(mean_step)
+        overhead_seconds.append(run_seconds - mean_step * len(step_times))
+        if use_cuda:
+            peak_memory.append(torch.cuda.max_memory_allocated())
+        print(f"Calibration {width}x{height}x{num_frames}: {tokens} tokens, "
+              f"{mean_step:.2f}s/step, {run_seconds:.1f}s total")
+        sys.stdout.flush()
+
+    step_intercept, step_slope = fit_linear(token_counts, step_seconds)
+    overhead_intercept, overhead_slope = fit_linear(token_counts, overhead_seconds)
+    calibration = {
+        "device": device_name,
+        "load_seconds": load_seconds,
+        "step_intercept_seconds": step_intercept,
+        "step_seconds_per_token": step_slope,
+        "overhead_intercept_seconds": overhead_intercept,
+        "overhead_seconds_per_token": overhead_slope,
+        "peak_memory_intercept_bytes": None,
+        "peak_memory_bytes_per_token": None,
+        "calibrated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    # Peak memory is only measurable cheaply on CUDA
+    if peak_memory:
+        memory_intercept, memory_slope = fit_linear(token_counts, peak_memory)
+        calibration["peak_memory_intercept_bytes"] = memory_intercept
+        calibration["peak_memory_bytes_per_token"] = memory_slope
+
+    calibrations = load_cache_file(CALIBRATION_FILE)
+    calibrations[platform.node()] = calibration
+    save_cache_file(CALIBRATION_FILE, calibrations)
+    return calibration
+
+DRAFT_SCALE = 0.5
+DRAFT_MAX_STEPS = 10
+DEFAULT_REFINE_STRENGTH = 0.4
+# Keys a refine request reads from a saved draft latents file
+DRAFT_LATENTS_KEYS = (
+    "latents", "width", "height", "fps", "duration_seconds",
+    "latent_num_frames", "latent_height", "latent_width",
+)
+
+def get_draft_parameters(width, height, steps):
+    """Return the reduced (width, height, steps) rendered by a draft request."""
+    draft_width = max(32, int(width * DRAFT_SCALE) // 32 * 32)
+    draft_height = max(32, int(height * DRAFT_SCALE) // 32 * 32)
+    return draft_width, draft_height, min(steps, DRAFT_MAX_STEPS)
+
+def get_refine_strength(request):
+    """Return a request's refine strength; hosts may send null for 'use the default'."""
+    return request.get('refine_strength') or DEFAULT_REFINE_STRENGTH
+
+def get_refine_steps(steps, strength):
+    """Return how many of a steps-long schedule a refine pass runs for the given strength."""
+    return max(1, min(steps, round(steps * strength)))
+
+def get_draft_latents_path(output_path):
+    """Return where a draft request saves its final latents, alongside the preview video."""
+    return os.path.splitext(output_path)[0] + ".latents.pt"
+
+def get_effective_parameters(request):
+    """
+    Return the generation parameters a request actually runs with.
+
+    Draft requests render at reduced resolution and steps; refine requests run only the
+    tail of the schedule, so 'steps' is the number of denoising steps executed.
+    """
+    parameters = {
+        "width": request['width'],
+        "height": request['height'],
+        "fps": request['fps'],
+        "duration_seconds": request['duration_seconds'],
+        "steps": request['steps'],
+        "guidance_scale": request['guidance_scale'],
+    }
+    if request.get('draft'):
+        parameters["width"], parameters["height"], parameters["steps"] = get_draft_parameters(
+            parameters["width"], parameters["height"], parameters["steps"])
+    elif request.get('refine_from'):
+        parameters["steps"] = get_refine_steps(
+            parameters["steps"], get_refine_strength(request))
+    return parameters
+
+class FinalLatentsCapture:
+    """Step-end callback that keeps a reference to the latents after the last executed step."""
+
+    def __init__(self, inner_callback=None):
+        self.inner_callback = inner_callback
+        self.latents = None
+
+    def __call__(self, pipe, step_index, timestep, callback_kwargs):
+        self.latents = callback_kwargs.get("latents")
+        if self.inner_callback:
+            return self.inner_callback(pipe, step_index, timestep, callback_kwargs)
+        return callback_kwargs
+
+def save_draft_latents(latents_path, latents, metadata):
+    """Save draft latents with the metadata a refine request needs to reuse them."""
+    import torch
+
+    torch.save(dict(metadata, latents=latents.detach().cpu()), latents_path)
+
+def load_draft_latents(latents_path):
+    """Load latents and metadata saved by a draft request."""
+    import torch
+
+    if not os.path.exists(latents_path):
+        raise FileNotFoundError(f"Draft latents not found: {latents_path}")
+    # The path comes from the request, so never unpickle arbitrary objects from it
+    draft_state = torch.load(latents_path, map_location='cpu', weights_only=True)
+    if not isinstance(draft_state, dict):
+        raise ValueError(f"Not a draft latents file: {latents_path}")
+    missing_keys = [key for key in DRAFT_LATENTS_KEYS if key not in draft_state]
+    if missing_keys:
+        raise ValueError(f"Draft latents file {latents_path} is missing: {', '.join(missing_keys)}")
+    return draft_state
+
+def prepare_refine_latents(pipe, draft_state, width, height, seed):
+    """
+    Upsample packed draft latents to the target resolution.
+
+    Returns (latents, noise) on the pipeline's device as float32, the dtype the LTX
+    pipelines prepare latents in, so the pipeline uses these tensors without copying.
+    """
+    import torch
+    import torch.nn.functional as F
+
+    spatial_ratio = getattr(pipe, "vae_spatial_compression_ratio", 32)
+    patch_size = getattr(pipe, "transformer_spatial_patch_size", 1)
+    patch_size_t = getattr(pipe, "transformer_temporal_patch_size", 1)
+
+    latents = pipe._unpack_latents(
+        draft_state["latents"].to(torch.float32),
+        draft_state["latent_num_frames"],
+        draft_state["latent_height"],
+        draft_state["latent_width"],
+        patch_size,
+        patch_size_t
+    )
+    latents = F.interpolate(
+        latents,
+        size=(draft_state["latent_num_frames"], height // spatial_ratio, width // spatial_ratio),
+        mode="trilinear",
+        align_corners=False
+    )
+    device = pipe._execution_device
+    latents = pipe._pack_latents(latents, patch_size, patch_size_t).to(device=device, dtype=torch.float32)
+
+    generator = torch.Generator(device=device).manual_seed(seed) if seed is not None else None
+    noise = torch.randn(latents.shape, generator=generator, device=device, dtype=torch.float32)
+    return latents, noise
+
+@contextlib.contextmanager
+def partial_schedule(scheduler, executed_steps, latents, noise):
+    """
+    Make the pipeline run only the last executed_steps of its schedule.
+
+    The pipeline computes its schedule (including the resolution-dependent shift) inside
+    __call__, after preparing latents. set_timesteps is wrapped so the schedule is cut down
+    to its tail, and the supplied latents are re-noised in place to the first kept sigma.
+    """
+    original_set_timesteps = scheduler.set_timesteps
+
+    # Keep the original signature: retrieve_timesteps inspects it for 'sigmas'/'timesteps' support
+    @functools.wraps(original_set_timesteps)
+    def set_timesteps(*args, **kwargs):
+        original_set_timesteps(*args, **kwargs)
+        start = max(0, len(scheduler.timesteps) - executed_steps)
+        scheduler.timesteps = scheduler.timesteps[start:]
+        scheduler.sigmas = scheduler.sigmas[start:]
+        sigma = float(scheduler.sigmas[0])
+        # Flow matching interpolates linearly between data and noise
+        latents.mul_(1.0 - sigma).add_(noise, alpha=sigma)
+        print(f"Refine: starting at sigma {sigma:.3f} for the last {len(scheduler.timesteps)} steps")
+
+    scheduler.set_timesteps = set_timesteps
+    try:
+        yield
+    finally:
+        scheduler.set_timesteps = original_set_timesteps
+
+def resolve_model_path(model_path):
+    """
+    Check the model path and work out how to load it.
+
+    Returns (model_file, model_dir); model_file is None when loading from a model directory.
+    """
+    print(f"Model path: {model_path}")
+    print(f"Path exists: {os.path.exists(model_path)}")
+    print(f"Is file: {os.path.isfile(model_path)}")
+    print(f"Is directory: {os.path.isdir(model_path)}")
+    
+    # Determine if model_path is a file or directory
+    if os.path.isfile(model_path):
+        # Single file - use from_single_file
+        model_file = model_path
+        model_dir = os.path.dirname(model_path)
+        print(f"Loading single model file: {os.path.basename(model_file)}")
+        print(f"From directory: {model_dir}")
+        
+        # Check if it's a .safetensors file and warn about potential issues
+        if model_file.endswith('.safetensors'):
+            print("WARNING: You are using a single .safetensors file.")
+            print("WARNING: This may be missing required components like T5EncoderModel.")
+            print("WARNING: Consider downloading the complete model directory instead.")
+            print("WARNING: Use 'git clone https://huggingface.co/Lightricks/LTX-Video' for the complete model.")
+        
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(f"Model file not found: {model_file}")
+    elif os.path.isdir(model_path):
+        # Directory - use from_pretrained
+        model_dir = model_path
+        model_file = None
+        print(f"Loading model from directory: {model_dir}")
+        
+        # Check for model_index.json
+        model_index_path = os.path.join(model_dir, "model_index.json")
+        if not os.path.exists(model_index_path):
+            print(f"ERROR: Model directory missing model_index.json: {model_dir}")
+            print("ERROR: This indicates the directory is incomplete or not a valid model directory.")
+            print("ERROR: Use 'git clone https://huggingface.co/Lightricks/LTX-Video' to download the complete model.")
+            raise FileNotFoundError(f"Model directory missing model_index.json: {model_dir}")
+        else:
+            print(f"Found model_index.json - validating model components...")
+
+        # Validate components and weight files before attempting any (slow) load
+        validation = validate_model_directory(model_dir)
+        if not validation["valid"]:
+            for problem in validation["problems"]:
+                print(f"ERROR: {problem}")
+            print("ERROR: Use 'git clone https://huggingface.co/Lightricks/LTX-Video' to download the complete model.")
+            raise FileNotFoundError(f"Model directory is incomplete: {'; '.join(validation['problems'])}")
+        print(f"Model directory validated{' (cached)' if validation['cached'] else ''}")
+    else:
+        raise FileNotFoundError(f"Model path not found: {model_path}")
+    
+    return model_file, model_dir
+
+def load_pipeline(pipeline_class, model_file, model_dir):
+    """Load the pipeline, falling back through dtypes and explicit T5 component loading."""
+    import torch
+    
+    try:
+        # Try different dtype options for better compatibility
+        try:
+            if model_file:
+                # Load from single file
+                pipe = pipeline_class.from_single_file(
+                    model_file, 
+                    torch_dtype=torch.float16
+                )
+                print("Loaded from single file with float16")
+            else:
+                # Load from directory - try without variant first for compatibility
+                pipe = pipeline_class.from_pretrained(
+                    model_dir, 
+                    torch_dtype=torch.float16
+                )
+                print("Loaded from directory with float16")
+        except Exception as dtype_error:
+            print(f"Error loading with float16: {dtype_error}", file=sys.stderr)
+            print("Trying with bfloat16...", file=sys.stderr)
+            try:
+                if model_file:
+                    pipe = pipeline_class.from_single_file(
+                        model_file, 
+                        torch_dtype=torch.bfloat16
+                    )
+                else:
+                    pipe = pipeline_class.from_pretrained(
+                        model_dir, 
+                        torch_dtype=torch.bfloat16
+                    )
+                print("Loaded with bfloat16")
+            except Exception as bfloat_error:
+                print(f"Error loading with bfloat16: {bfloat_error}", file=sys.stderr)
+                print("Trying with float32...", file=sys.stderr)
+                if model_file:
+                    pipe = pipeline_class.from_single_file(
+                        model_file, 
+                        torch_dtype=torch.float32
+                    )
+                else:
+                    pipe = pipeline_class.from_pretrained(
+                        model_dir, 
+                        torch_dtype=torch.float32
+                    )
+                print("Loaded with float32")
+    except Exception as e:
+        error_msg = str(e)
+        print(f"Error loading pipeline: {error_msg}", file=sys.stderr)
+        
+        # Check for specific T5 tokenizer/component loading errors
+        if ("_LazyModule" in error_msg and "Placeholder" in error_msg) or "cannot be loaded" in error_msg:
+            print("", file=sys.stderr)
+            print("=" * 80, file=sys.stderr)
+            print("CRITICAL ERROR: T5 Tokenizer/Component Loading Issue", file=sys.stderr)
+            print("=" * 80, file=sys.stderr)
+            print("This is likely due to missing sentencepiece dependency or transformers compatibility issue.", file=sys.stderr)
+            print("", file=sys.stderr)
+            print("SOLUTIONS to try:", file=sys.stderr)
+            print("1. Install missing dependency:", file=sys.stderr)
+            print("   pip install sentencepiece", file=sys.stderr)
+            print("", file=sys.stderr)
+            print("2. Update your packages:", file=sys.stderr)
+            print("   pip install --upgrade transformers diffusers torch", file=sys.stderr)
+            print("", file=sys.stderr)
+            print("3. If using a complete model directory, ensure it contains all files:", file=sys.stderr)
+            print("   - model_index.json", file=sys.stderr)
+            print("   - text_encoder/ directory with T5 model files", file=sys.stderr)
+            print("   - tokenizer/ directory with T5 tokenizer files", file=sys.stderr)
+            print("", file=sys.stderr)
+            print("4. Download the complete model if missing:", file=sys.stderr)
+            print("   git clone https://huggingface.co/Lightricks/LTX-Video", file=sys.stderr)
+            print("=" * 80, file=sys.stderr)
+            raise RuntimeError("T5 tokenizer loading failed. Please install sentencepiece and ensure complete model directory.")
+            
+        # Check for specific T5EncoderModel error  
+        elif "T5EncoderModel" in error_msg and "missing" in error_msg:
+            print("", file=sys.stderr)
+            print("=" * 80, file=sys.stderr)
+            print("CRITICAL ERROR: T5EncoderModel Missing", file=sys.stderr)
+            print("=" * 80, file=sys.stderr)
+            print("The single .safetensors file you're using is incomplete and missing the T5EncoderModel.", file=sys.stderr)
+            print("", file=sys.stderr)
+            print("SOLUTION: You need to download the complete LTX-Video model directory.", file=sys.stderr)
+            print("", file=sys.stderr)
+            print("Method 1 - Git Clone (Recommended):", file=sys.stderr)
+            print("  git clone https://huggingface.co/Lightricks/LTX-Video", file=sys.stderr)
+            print("", file=sys.stderr)
+            print("Method 2 - Download from Hugging Face:", file=sys.stderr)
+            print("  1. Go to: https://huggingface.co/Lightricks/LTX-Video", file=sys.stderr)
+            print("  2. Click 'Download repository'", file=sys.stderr)
+            print("  3. Point the model path to the downloaded directory (not the .safetensors file)", file=sys.stderr)
+            print("", file=sys.stderr)
+            print("Method 3 - Use Hugging Face Hub:", file=sys.stderr)
+            print("  pip install huggingface_hub", file=sys.stderr)
+            print("  huggingface-cli download Lightricks/LTX-Video --local-dir ./LTX-Video", file=sys.stderr)
+            print("", file=sys.stderr)
+            print("After downloading, set your model path to the directory containing model_index.json", file=sys.stderr)
+            print("=" * 80, file=sys.stderr)
+            raise RuntimeError("Cannot proceed with incomplete model. Please download the complete model directory.")
+        
+        # Try fallback loading for other errors
+        print("Attempting fallback loading without dtype specification...", file=sys.stderr)
+        try:
+            if model_file:
+                pipe = pipeline_class.from_single_file(model_file)
+            else:
+                pipe = pipeline_class.from_pretrained(model_dir)
+            print("Fallback loading successful", file=sys.stderr)
+        except Exception as fallback_e:
+            fallback_error_msg = str(fallback_e)
+            print(f"Fallback loading also failed: {fallback_error_msg}", file=sys.stderr)
+            
+            # Final attempt with explicit tokenizer/text_encoder loading for T5 issues
+            if ("_LazyModule" in fallback_error_msg and "Placeholder" in fallback_error_msg) or "cannot be loaded" in fallback_error_msg:
+                print("Attempting final fallback with explicit component loading...", file=sys.stderr)
+                try:
+                    from transformers import T5Tokenizer, T5EncoderModel
+                    
+                    if model_file:
+                        print("ERROR: Cannot use explicit component loading with single file.", file=sys.stderr)
+                        print("ERROR: Please use complete model directory instead.", file=sys.stderr)
+                        raise RuntimeError("Cannot use explicit component loading with single file. Please use complete model directory.")
+                    
+                    # Try to load components explicitly
+                    tokenizer_path = os.path.join(model_dir, "tokenizer")
+                    text_encoder_path = os.path.join(model_dir, "text_encoder")
+                    
+                    if not os.path.exists(tokenizer_path):
+                        raise FileNotFoundError(f"Tokenizer directory not found: {tokenizer_path}")
+                    if not os.path.exists(text_encoder_path):
+                        raise FileNotFoundError(f"Text encoder directory not found: {text_encoder_path}")
+                    
+                    print(f"Loading tokenizer from: {tokenizer_path}", file=sys.stderr)
+                    tokenizer = T5Tokenizer.from_pretrained(tokenizer_path)
+                    
+                    print(f"Loading text encoder from: {text_encoder_path}", file=sys.stderr)
+                    text_encoder = T5EncoderModel.from_pretrained(text_encoder_path)
+                    
+                    print("Loading pipeline with explicit components...", file=sys.stderr)
+                    pipe = pipeline_class.from_pretrained(
+                        model_dir,
+                        tokenizer=tokenizer,
+                        text_encoder=text_encoder
+                    )
+                    print("Explicit component loading successful", file=sys.stderr)
+                except Exception as final_e:
+                    print(f"Final fallback also failed: {final_e}", file=sys.stderr)
+                    print("", file=sys.stderr)
+                    print("All loading attempts failed. This suggests:", file=sys.stderr)
+                    print("1. Missing sentencepiece dependency: pip install sentencepiece", file=sys.stderr)
+                    print("2. Incompatible package versions", file=sys.stderr)
+                    print("3. Incomplete model directory", file=sys.stderr)
+                    raise RuntimeError(f"All loading attempts failed. Original error: {error_msg}")
+            else:
+                raise
+    
+    return pipe
+
 def generate_video(request):
-    """Generate video based on the request parameters."""
+    """
+    Generate video based on the request parameters.
+
+    Returns a dict describing the parameters actually used and the elapsed time.
+    """
+    start_time = time.monotonic()
     try:
         # Import here after dependency check
         import torch
@@ -62,49 +1029,42 @@ def generate_video(request):
         height = request['height']
         fps = request['fps']
         input_image = request.get('input_image')  # Optional image for image-to-video
+        deadline_seconds = request.get('deadline_seconds')  # Optional wall-clock budget for the whole job
+        draft = bool(request.get('draft'))  # Optional low-cost preview that also saves its latents
+        refine_from = request.get('refine_from')  # Optional draft latents file to refine at full resolution
+        requested_parameters = {
+            "width": width, "height": height, "fps": fps,
+            "duration_seconds": duration_seconds, "steps": steps, "guidance_scale": guidance_scale
+        }
         
-        print(f"Model path: {model_path}")
-        print(f"Path exists: {os.path.exists(model_path)}")
-        print(f"Is file: {os.path.isfile(model_path)}")
-        print(f"Is directory: {os.path.isdir(model_path)}")
-        
-        # Determine if model_path is a file or directory
-        if os.path.isfile(model_path):
-            # Single file - use from_single_file
-            model_file = model_path
-            model_dir = os.path.dirname(model_path)
-            print(f"Loading single model file: {os.path.basename(model_file)}")
-            print(f"From directory: {model_dir}")
-            
-            # Check if it's a .safetensors file and warn about potential issues
-            if model_file.endswith('.safetensors'):
-                print("WARNING: You are using a single .safetensors file.")
-                print("WARNING: This may be missing required components like T5EncoderModel.")
-                print("WARNING: Consider downloading the complete model directory instead.")
-                print("WARNING: Use 'git clone https://huggingface.co/Lightricks/LTX-Video' for the complete model.")
-            
-            if not os.path.exists(model_file):
-                raise FileNotFoundError(f"Model file not found: {model_file}")
-        elif os.path.isdir(model_path):
-            # Directory - use from_pretrained
-            model_dir = model_path
-            model_file = None
-            print(f"Loading model from directory: {model_dir}")
-            
-            # Check for model_index.json
-            model_index_path = os.path.join(model_dir, "model_index.json")
-            if not os.path.exists(model_index_path):
-                print(f"ERROR: Model directory missing model_index.json: {model_dir}")
-                print("ERROR: This indicates the directory is incomplete or not a valid model directory.")
-                print("ERROR: Use 'git clone https://huggingface.co/Lightricks/LTX-Video' to download the complete model.")
-                raise FileNotFoundError(f"Model directory missing model_index.json: {model_dir}")
-            else:
-                print(f"Found model_index.json - this looks like a complete model directory")
-        else:
-            raise FileNotFoundError(f"Model path not found: {model_path}")
+        use_image_to_video = input_image is not None and input_image.strip() != ""
+        if (draft or refine_from) and use_image_to_video:
+            raise ValueError("Draft and refine requests are only supported for text-to-video")
+        if draft and refine_from:
+            raise ValueError("A request cannot be both a draft and a refine")
+        
+        # Drafts render smaller and shorter; refines run only the tail of a steps-long schedule.
+        # schedule_steps is the schedule length passed to the pipeline, steps the steps actually run.
+        draft_state = None
+        effective_parameters = get_effective_parameters(request)
+        schedule_steps = steps if refine_from else effective_parameters["steps"]
+        width, height, steps = effective_parameters["width"], effective_parameters["height"], effective_parameters["steps"]
+        if draft:
+            print(f"Draft: rendering at {width}x{height} with {steps} steps")
+        elif refine_from:
+            draft_state = load_draft_latents(refine_from)
+            # The draft fixes the latent frame count, so keep its timing
+            duration_seconds, fps = draft_state["duration_seconds"], draft_state["fps"]
+            if draft_state.get("model_path") != model_path:
+                print(f"WARNING: Draft was rendered with a different model: {draft_state.get('model_path')}", file=sys.stderr)
+            print(f"Refine: {draft_state['width']}x{draft_state['height']} draft -> {width}x{height}, "
+                  f"last {steps} of {schedule_steps} steps")
+        
+        device_name = torch.cuda.get_device_name() if torch.cuda.is_available() else "cpu"
+        
+        model_file, model_dir = resolve_model_path(model_path)
         
         # Determine which pipeline to use based on whether an image is provided
-        use_image_to_video = input_image is not None and input_image.strip() != ""
         pipeline_class = LTXImageToVideoPipeline if use_image_to_video else LTXPipeline
         pipeline_name = "Image-to-Video" if use_image_to_video else "Text-to-Video"
         
@@ -116,162 +1076,7 @@ def generate_video(request):
         sys.stdout.flush()
         
         # Load the LTX Video pipeline
-        try:
-            # Try different dtype options for better compatibility
-            try:
-                if model_file:
-                    # Load from single file
-                    pipe = pipeline_class.from_single_file(
-                        model_file, 
-                        torch_dtype=torch.float16
-                    )
-                    print("Loaded from single file with float16")
-                else:
-                    # Load from directory - try without variant first for compatibility
-                    pipe = pipeline_class.from_pretrained(
-                        model_dir, 
-                        torch_dtype=torch.float16
-                    )
-                    print("Loaded from directory with float16")
-            except Exception as dtype_error:
-                print(f"Error loading with float16: {dtype_error}", file=sys.stderr)
-                print("Trying with bfloat16...", file=sys.stderr)
-                try:
-                    if model_file:
-                        pipe = pipeline_class.from_single_file(
-                            model_file, 
-                            torch_dtype=torch.bfloat16
-                        )
-                    else:
-                        pipe = pipeline_class.from_pretrained(
-                            model_dir, 
-                            torch_dtype=torch.bfloat16
-                        )
-                    print("Loaded with bfloat16")
-                except Exception as bfloat_error:
-                    print(f"Error loading with bfloat16: {bfloat_error}", file=sys.stderr)
-                    print("Trying with float32...", file=sys.stderr)
-                    if model_file:
-                        pipe = pipeline_class.from_single_file(
-                            model_file, 
-                            torch_dtype=torch.float32
-                        )
-                    else:
-                        pipe = pipeline_class.from_pretrained(
-                            model_dir, 
-                            torch_dtype=torch.float32
-                        )
-                    print("Loaded with float32")
-        except Exception as e:
-            error_msg = str(e)
-            print(f"Error loading pipeline: {error_msg}", file=sys.stderr)
-            
-            # Check for specific T5 tokenizer/component loading errors
-            if ("_LazyModule" in error_msg and "Placeholder" in error_msg) or "cannot be loaded" in error_msg:
-                print("", file=sys.stderr)
-                print("=" * 80, file=sys.stderr)
-                print("CRITICAL ERROR: T5 Tokenizer/Component Loading Issue", file=sys.stderr)
-                print("=" * 80, file=sys.stderr)
-                print("This is likely due to missing sentencepiece dependency or transformers compatibility issue.", file=sys.stderr)
-                print("", file=sys.stderr)
-                print("SOLUTIONS to try:", file=sys.stderr)
-                print("1. Install missing dependency:", file=sys.stderr)
-                print("   pip install sentencepiece", file=sys.stderr)
-                print("", file=sys.stderr)
-                print("2. Update your packages:", file=sys.stderr)
-                print("   pip install --upgrade transformers diffusers torch", file=sys.stderr)
-                print("", file=sys.stderr)
-                print("3. If using a complete model directory, ensure it contains all files:", file=sys.stderr)
-                print("   - model_index.json", file=sys.stderr)
-                print("   - text_encoder/ directory with T5 model files", file=sys.stderr)
-                print("   - tokenizer/ directory with T5 tokenizer files", file=sys.stderr)
-                print("", file=sys.stderr)
-                print("4. Download the complete model if missing:", file=sys.stderr)
-                print("   git clone https://huggingface.co/Lightricks/LTX-Video", file=sys.stderr)
-                print("=" * 80, file=sys.stderr)
-                raise RuntimeError("T5 tokenizer loading failed. Please install sentencepiece and ensure complete model directory.")
-                
-            # Check for specific T5EncoderModel error  
-            elif "T5EncoderModel" in error_msg and "missing" in error_msg:
-                print("", file=sys.stderr)
-                print("=" * 80, file=sys.stderr)
-                print("CRITICAL ERROR: T5EncoderModel Missing", file=sys.stderr)
-                print("=" * 80, file=sys.stderr)
-                print("The single .safetensors file you're using is incomplete and missing the T5EncoderModel.", file=sys.stderr)
-                print("", file=sys.stderr)
-                print("SOLUTION: You need to download the complete LTX-Video model directory.", file=sys.stderr)
-                print("", file=sys.stderr)
-                print("Method 1 - Git Clone (Recommended):", file=sys.stderr)
-                print("  git clone https://huggingface.co/Lightricks/LTX-Video", file=sys.stderr)
-                print("", file=sys.stderr)
-                print("Method 2 - Download from Hugging Face:", file=sys.stderr)
-                print("  1. Go to: https://huggingface.co/Lightricks/LTX-Video", file=sys.stderr)
-                print("  2. Click 'Download repository'", file=sys.stderr)
-                print("  3. Point the model path to the downloaded directory (not the .safetensors file)", file=sys.stderr)
-                print("", file=sys.stderr)
-                print("Method 3 - Use Hugging Face Hub:", file=sys.stderr)
-                print("  pip install huggingface_hub", file=sys.stderr)
-                print("  huggingface-cli download Lightricks/LTX-Video --local-dir ./LTX-Video", file=sys.stderr)
-                print("", file=sys.stderr)
-                print("After downloading, set your model path to the directory containing model_index.json", file=sys.stderr)
-                print("=" * 80, file=sys.stderr)
-                raise RuntimeError("Cannot proceed with incomplete model. Please download the complete model directory.")
-            
-            # Try fallback loading for other errors
-            print("Attempting fallback loading without dtype specification...", file=sys.stderr)
-            try:
-                if model_file:
-                    pipe = pipeline_class.from_single_file(model_file)
-                else:
-                    pipe = pipeline_class.from_pretrained(model_dir)
-                print("Fallback loading successful", file=sys.stderr)
-            except Exception as fallback_e:
-                fallback_error_msg = str(fallback_e)
-                print(f"Fallback loading also failed: {fallback_error_msg}", file=sys.stderr)
-                
-                # Final attempt with explicit tokenizer/text_encoder loading for T5 issues
-                if ("_LazyModule" in fallback_error_msg and "Placeholder" in fallback_error_msg) or "cannot be loaded" in fallback_error_msg:
-                    print("Attempting final fallback with explicit component loading...", file=sys.stderr)
-                    try:
-                        from transformers import T5Tokenizer, T5EncoderModel
-                        
-                        if model_file:
-                            print("ERROR: Cannot use explicit component loading with single file.", file=sys.stderr)
-                            print("ERROR: Please use complete model directory instead.", file=sys.stderr)
-                            raise RuntimeError("Cannot use explicit component loading with single file. Please use complete model directory.")
-                        
-                        # Try to load components explicitly
-                        tokenizer_path = os.path.join(model_dir, "tokenizer")
-                        text_encoder_path = os.path.join(model_dir, "text_encoder")
-                        
-                        if not os.path.exists(tokenizer_path):
-                            raise FileNotFoundError(f"Tokenizer directory not found: {tokenizer_path}")
-                        if not os.path.exists(text_encoder_path):
-                            raise FileNotFoundError(f"Text encoder directory not found: {text_encoder_path}")
-                        
-                        print(f"Loading tokenizer from: {tokenizer_path}", file=sys.stderr)
-                        tokenizer = T5Tokenizer.from_pretrained(tokenizer_path)
-                        
-                        print(f"Loading text encoder from: {text_encoder_path}", file=sys.stderr)
-                        text_encoder = T5EncoderModel.from_pretrained(text_encoder_path)
-                        
-                        print("Loading pipeline with explicit components...", file=sys.stderr)
-                        pipe = pipeline_class.from_pretrained(
-                            model_dir,
-                            tokenizer=tokenizer,
-                            text_encoder=text_encoder
-                        )
-                        print("Explicit component loading successful", file=sys.stderr)
-                    except Exception as final_e:
-                        print(f"Final fallback also failed: {final_e}", file=sys.stderr)
-                        print("", file=sys.stderr)
-                        print("All loading attempts failed. This suggests:", file=sys.stderr)
-                        print("1. Missing sentencepiece dependency: pip install sentencepiece", file=sys.stderr)
-                        print("2. Incompatible package versions", file=sys.stderr)
-                        print("3. Incomplete model directory", file=sys.stderr)
-                        raise RuntimeError(f"All loading attempts failed. Original error: {error_msg}")
-                else:
-                    raise
+        pipe = load_pipeline(pipeline_class, model_file, model_dir)
         
         # Progress: Model loaded, preparing for generation
         print("STATUS: Model loaded successfully")
@@ -286,6 +1091,40 @@ def generate_video(request):
         else:
             print("Using CPU (this will be significantly slower)")
         
+        # Plan against the deadline using this host's recorded step costs
+        host_key = get_host_key(device_name)
+        cost_model = load_step_costs(host_key)
+        deadline_adjustments = []
+        if deadline_seconds:
+            budget_seconds = deadline_seconds - (time.monotonic() - start_time)
+            print(f"Deadline: {deadline_seconds}s total, {budget_seconds:.1f}s remaining after model load")
+            if cost_model:
+                effective_parameters.update(duration_seconds=duration_seconds, fps=fps)
+                planned, deadline_adjustments = plan_generation_for_deadline(effective_parameters, budget_seconds, cost_model)
+                width, height, fps, steps = planned["width"], planned["height"], planned["fps"], planned["steps"]
+                schedule_steps = steps
+                if refine_from:
+                    # The draft's latent frame count cannot change, and fewer refine steps mean a shorter schedule
+                    fps = draft_state["fps"]
+                    schedule_steps = max(steps, round(steps / get_refine_strength(request)))
+                for adjustment in deadline_adjustments:
+                    print(f"Deadline: {adjustment}")
+                predicted_seconds = predict_generation_seconds(planned, cost_model)
+                print(f"Deadline: predicted {predicted_seconds:.1f}s from {cost_model.get('samples', 0)} previous job(s) on this host")
+            else:
+                print("Deadline: no recorded step costs for this host yet; adapting from measured steps only")
+        
+        # Estimate the parameters that will actually run (after draft/refine and deadline planning),
+        # with this device's calibration, so it can be compared with the actual run afterwards
+        estimate = estimate_parameters(
+            dict(effective_parameters, width=width, height=height, fps=fps,
+                 duration_seconds=duration_seconds, steps=steps),
+            load_calibration(device_name),
+            load_host_step_costs(device_name)
+        )
+        if estimate:
+            print(f"Estimate: {estimate['estimated_seconds']}s ({estimate['source']})")
+        
         # Set seed for reproducibility
         if seed is not None:
             torch.manual_seed(seed)
@@ -311,6 +1150,36 @@ def generate_video(request):
             else:
                 raise FileNotFoundError(f"Input image not found: {input_image}")
         
+        # Step-end callbacks are only used in deadline and draft modes, where the pipeline must support them
+        pipeline_kwargs = {}
+        deadline_controller = None
+        latents_capture = None
+        supports_step_callbacks = "callback_on_step_end" in inspect.signature(pipe.__call__).parameters
+        if deadline_seconds:
+            if supports_step_callbacks:
+                overhead_estimate = None
+                if cost_model and "overhead_seconds_per_token" in cost_model:
+                    overhead_estimate = cost_model["overhead_seconds_per_token"] * get_latent_token_count(width, height, num_frames)
+                deadline_controller = DeadlineController(
+                    start_time + deadline_seconds, steps, steps + 3, overhead_estimate,
+                    synchronize=torch.cuda.synchronize if torch.cuda.is_available() else None
+                )
+                pipeline_kwargs["callback_on_step_end"] = deadline_controller
+            else:
+                print("WARNING: Pipeline does not support step callbacks; steps cannot be adapted during generation", file=sys.stderr)
+        if draft:
+            if not supports_step_callbacks:
+                raise RuntimeError("Draft mode requires a pipeline that supports callback_on_step_end")
+            latents_capture = FinalLatentsCapture(deadline_controller)
+            pipeline_kwargs["callback_on_step_end"] = latents_capture
+        
+        # Refines start from the upsampled draft latents, re-noised once the schedule is known
+        schedule_context = contextlib.nullcontext()
+        if refine_from:
+            refine_latents, refine_noise = prepare_refine_latents(pipe, draft_state, width, height, seed)
+            pipeline_kwargs["latents"] = refine_latents
+            schedule_context = partial_schedule(pipe.scheduler, steps, refine_latents, refine_noise)
+        
         # Progress: Starting generation
         print("STATUS: Starting video generation...")
         print(f"PROGRESS: Step 3 of {steps + 3}")
@@ -320,29 +1189,37 @@ def generate_video(request):
         try:
             # Note: callback parameter removed due to LTX pipeline compatibility
             # Progress will be tracked through intermediate status updates
+            # (callback_on_step_end is only passed in deadline and draft modes)
+            
+            if deadline_controller:
+                deadline_controller.mark_start()
             
             print(f"Starting video generation with {num_frames} frames...")
             sys.stdout.flush()
             
-            if use_image_to_video:
-                result = pipe(
-                    image=image,
-                    prompt=prompt,
-                    num_inference_steps=steps,
-                    guidance_scale=guidance_scale,
-                    width=width,
-                    height=height,
-                    num_frames=num_frames
-                )
-            else:
-                result = pipe(
-                    prompt=prompt,
-                    num_inference_steps=steps,
-                    guidance_scale=guidance_scale,
-                    width=width,
-                    height=height,
-                    num_frames=num_frames
-                )
+            with schedule_context:
+                if use_image_to_video:
+                    result = pipe(
+                        image=image,
+                        prompt=prompt,
+                        num_inference_steps=schedule_steps,
+                        guidance_scale=guidance_scale,
+                        width=width,
+                        height=height,
+                        num_frames=num_frames,
+                        **pipeline_kwargs
+                    )
+                else:
+                    result = pipe(
+                        prompt=prompt,
+                        num_inference_steps=schedule_steps,
+                        guidance_scale=guidance_scale,
+                        width=width,
+                        height=height,
+                        num_frames=num_frames,
+                        **pipeline_kwargs
+                    )
+            denoise_end_time = deadline_controller.last_time if deadline_controller else None
             
             print("Video generation completed, extracting frames...")
             sys.stdout.flush()
@@ -419,6 +1296,76 @@ def generate_video(request):
             sys.stdout.flush()
         else:
             raise FileNotFoundError("Video file was not created")
+        
+        if draft:
+            draft_latents_path = get_draft_latents_path(output_path)
+            save_draft_latents(draft_latents_path, latents_capture.latents, {
+                "model_path": model_path,
+                "prompt": prompt,
+                "seed": seed,
+                "width": width,
+                "height": height,
+                "fps": fps,
+                "duration_seconds": duration_seconds,
+                "num_frames": num_frames,
+                "latent_num_frames": (num_frames - 1) // getattr(pipe, "vae_temporal_compression_ratio", 8) + 1,
+                "latent_height": height // getattr(pipe, "vae_spatial_compression_ratio", 32),
+                "latent_width": width // getattr(pipe, "vae_spatial_compression_ratio", 32),
+            })
+            print(f"Draft latents saved to: {draft_latents_path}")
+        
+        elapsed_seconds = time.monotonic() - start_time
+        steps_used = steps
+        if deadline_controller:
+            steps_used = deadline_controller.steps_completed
+            deadline_adjustments.extend(deadline_controller.adjustments)
+            
+            # Keep this host's measured costs so the next deadline job can plan before starting
+            step_seconds = deadline_controller.measured_step_seconds()
+            if step_seconds and denoise_end_time:
+                tokens = get_latent_token_count(width, height, num_frames)
+                overhead_seconds = time.monotonic() - denoise_end_time
+                record_step_costs(
+                    host_key,
+                    step_seconds / (tokens * get_guidance_batch_size(guidance_scale)),
+                    overhead_seconds / tokens
+                )
+        
+        result = {
+            "output_path": output_path,
+            "width": width,
+            "height": height,
+            "fps": fps,
+            "num_frames": num_frames,
+            "steps": steps_used,
+            "guidance_scale": guidance_scale,
+            "elapsed_seconds": round(elapsed_seconds, 2),
+        }
+        if estimate:
+            actual_peak_memory_bytes = torch.cuda.max_memory_allocated() if torch.cuda.is_available() else None
+            result["estimate"] = {
+                "source": estimate["source"],
+                "steps": estimate["steps"],
+                "num_frames": estimate["num_frames"],
+                "estimated_seconds": estimate["estimated_seconds"],
+                "actual_seconds": result["elapsed_seconds"],
+                "estimated_peak_memory_bytes": estimate["peak_memory_bytes"],
+                "actual_peak_memory_bytes": actual_peak_memory_bytes,
+            }
+            print(f"Estimate vs actual: {estimate['estimated_seconds']}s estimated, {result['elapsed_seconds']}s actual")
+        if draft:
+            result["draft_latents_path"] = draft_latents_path
+        if refine_from:
+            result["refined_from"] = refine_from
+            result["schedule_steps"] = schedule_steps
+        if deadline_seconds:
+            result["deadline_seconds"] = deadline_seconds
+            result["deadline_met"] = elapsed_seconds <= deadline_seconds
+            result["adjustments"] = deadline_adjustments
+            result["requested"] = requested_parameters
+        print(f"RESULT: {json.dumps(result)}")
+        sys.stdout.flush()
+        return result
             
     except Exception as e:
         print(f"Error during video generation: {str(e)}", file=sys.stderr)
@@ -429,9 +1376,34 @@ def main():
     parser = argparse.ArgumentParser(description='Generate videos using LTX Video model')
     parser.add_argument('request_file', nargs='?', help='JSON file containing generation request')
     parser.add_argument('--check-deps', action='store_true', help='Check dependencies and exit')
-    
+    parser.add_argument('--validate-model', metavar='MODEL_DIR', help='Validate a model directory without loading it and exit')
+    parser.add_argument('--estimate', metavar='REQUEST_FILE', help='Print estimated wall time and peak memory for a request as JSON and exit')
+    parser.add_argument('--calibrate', metavar='MODEL_PATH', help='Run a short calibration on this host for --estimate and exit')
+
     args = parser.parse_args()
+
+    # Model validation only reads files on disk, so it does not need the ML dependencies
+    if args.validate_model:
+        validation = validate_model_directory(args.validate_model)
+        print(json.dumps(validation, indent=2))
+        sys.exit(0 if validation["valid"] else 1)
     
+    # Estimation only reads the request and this host's calibration, so it is cheap to call before submitting
+    if args.estimate:
+        request = load_request(args.estimate)
+        if request is None:
+            sys.exit(1)
+        try:
+            estimate = estimate_request(request, load_calibration(), load_host_step_costs())
+        except KeyError as e:
+            print(json.dumps({"error": f"Request is missing field: {e}"}))
+            sys.exit(1)
+        if estimate is None:
+            print(json.dumps({"error": "This host has not been calibrated. Run with --calibrate MODEL_PATH first."}))
+            sys.exit(1)
+        print(json.dumps(estimate, indent=2))
+        sys.exit(0)
+
     # Check dependencies first
     if not check_dependencies():
         sys.exit(1)
@@ -440,6 +1412,15 @@ def main():
         print("All dependencies are available")
         sys.exit(0)
     
+    if args.calibrate:
+        try:
+            calibration = calibrate(args.calibrate)
+            print(json.dumps(calibration, indent=2))
+        except Exception as e:
+            print(f"FAILED: Calibration failed: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
+    
     # If not checking deps, request_file is required
     if not args.request_file:
         parser.error("request_file is required when not using --check-deps")
@@ -8,9 +8,15 @@ from unittest.mock import Mock, patch, mock_open
 import sys
 import json
 import os
+import inspect
+import struct
 import tempfile
+import types
 
-# We'll test functions individually without importing the full module to avoid dependency issues
+# The generator only imports torch/diffusers inside functions, so the module itself
+# can be imported to test the pure-Python helpers directly
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'python'))
+import ltx_video_generator
 
 
 class TestLoadRequestFunction(unittest.TestCase):
@@ -265,6 +271,654 @@ class TestVideoGenerationLogic(unittest.TestCase):
         self.assertEqual(f"{file_size_mb:.2f} MB", "1.00 MB")
 
 
+
+def write_safetensors(path, data_length, truncate_by=0):
+    """Write a minimal .safetensors file with one tensor of data_length bytes."""
+    header = json.dumps({"weight": {"dtype": "U8", "shape": [data_length], "data_offsets": [0, data_length]}}).encode()
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.write(b'\0' * (data_length - truncate_by))
+
+
+class TestModelDirectoryValidation(unittest.TestCase):
+    """Test validate_model_directory against small on-disk model layouts."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.model_dir = os.path.join(self.temp_dir.name, "model")
+        self.cache_dir = os.path.join(self.temp_dir.name, "cache")
+        os.makedirs(self.model_dir)
+        env_patcher = patch.dict(os.environ, {"LTX_VIDEO_CACHE_DIR": self.cache_dir})
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+        self.addCleanup(self.temp_dir.cleanup)
+
+        self.write_json("model_index.json", {
+            "_class_name": "LTXPipeline",
+            "scheduler": ["diffusers", "FlowMatchEulerDiscreteScheduler"],
+            "text_encoder": ["transformers", "T5EncoderModel"],
+            "tokenizer": ["transformers", "T5Tokenizer"],
+            "transformer": ["diffusers", "LTXVideoTransformer3DModel"],
+            "vae": [None, None]
+        })
+        self.write_json("scheduler/scheduler_config.json", {})
+        self.write_json("tokenizer/tokenizer_config.json", {})
+        self.write_file("tokenizer/spiece.model", b"model")
+        self.write_json("text_encoder/config.json", {})
+        self.write_json("text_encoder/model.safetensors.index.json", {
+            "weight_map": {"a": "model-00001-of-00002.safetensors", "b": "model-00002-of-00002.safetensors"}
+        })
+        write_safetensors(self.path("text_encoder/model-00001-of-00002.safetensors"), 16)
+        write_safetensors(self.path("text_encoder/model-00002-of-00002.safetensors"), 16)
+        self.write_json("transformer/config.json", {})
+        write_safetensors(self.path("transformer/diffusion_pytorch_model.safetensors"), 32)
+
+    def path(self, relative_path):
+        return os.path.join(self.model_dir, *relative_path.split('/'))
+
+    def write_file(self, relative_path, content):
+        os.makedirs(os.path.dirname(self.path(relative_path)), exist_ok=True)
+        with open(self.path(relative_path), 'wb') as f:
+            f.write(content)
+
+    def write_json(self, relative_path, data):
+        self.write_file(relative_path, json.dumps(data).encode())
+
+    def test_complete_directory_is_valid(self):
+        """Test that a complete directory passes and optional [null, null] components are skipped."""
+        result = ltx_video_generator.validate_model_directory(self.model_dir)
+        self.assertTrue(result["valid"], result["problems"])
+        self.assertFalse(result["cached"])
+
+    def test_missing_model_index(self):
+        """Test that a directory without model_index.json is rejected."""
+        os.remove(self.path("model_index.json"))
+        result = ltx_video_generator.validate_model_directory(self.model_dir)
+        self.assertFalse(result["valid"])
+        self.assertIn("model_index.json", result["problems"][0])
+
+    def test_missing_component_directory(self):
+        """Test that a missing text_encoder/ directory is reported."""
+        import shutil
+        shutil.rmtree(self.path("text_encoder"))
+        result = ltx_video_generator.validate_model_directory(self.model_dir)
+        self.assertFalse(result["valid"])
+        self.assertEqual(result["problems"], ["Missing component directory: text_encoder/"])
+
+    def test_missing_tokenizer_files(self):
+        """Test that a tokenizer without its vocabulary file is reported."""
+        os.remove(self.path("tokenizer/spiece.model"))
+        result = ltx_video_generator.validate_model_directory(self.model_dir)
+        self.assertFalse(result["valid"])
+        self.assertIn("tokenizer/", result["problems"][0])
+
+    def test_missing_shard(self):
+        """Test that a shard referenced by the weight map but absent is reported."""
+        os.remove(self.path("text_encoder/model-00002-of-00002.safetensors"))
+        result = ltx_video_generator.validate_model_directory(self.model_dir)
+        self.assertFalse(result["valid"])
+        self.assertIn("model-00002-of-00002.safetensors", result["problems"][0])
+
+    def test_leftover_bin_index_next_to_safetensors_is_ignored(self):
+        """Test that a .bin index is not checked when the loader would use the safetensors weights."""
+        self.write_json("text_encoder/pytorch_model.bin.index.json", {
+            "weight_map": {"a": "pytorch_model-00001-of-00001.bin"}
+        })
+        self.write_file("transformer/diffusion_pytorch_model.bin", b"")
+        result = ltx_video_generator.validate_model_directory(self.model_dir)
+        self.assertTrue(result["valid"], result["problems"])
+
+    def test_bin_index_is_checked_without_safetensors(self):
+        """Test that a .bin-only sharded checkpoint still has its shards checked."""
+        for name in os.listdir(self.path("text_encoder")):
+            if name.startswith("model"):
+                os.remove(self.path("text_encoder/" + name))
+        self.write_json("text_encoder/pytorch_model.bin.index.json", {
+            "weight_map": {"a": "pytorch_model-00001-of-00001.bin"}
+        })
+        result = ltx_video_generator.validate_model_directory(self.model_dir)
+        self.assertFalse(result["valid"])
+        self.assertIn("pytorch_model-00001-of-00001.bin", result["problems"][0])
+
+    def test_truncated_safetensors(self):
+        """Test that a partially downloaded .safetensors file is detected from its header."""
+        write_safetensors(self.path("transformer/diffusion_pytorch_model.safetensors"), 32, truncate_by=4)
+        result = ltx_video_generator.validate_model_directory(self.model_dir)
+        self.assertFalse(result["valid"])
+        self.assertIn("truncated", result["problems"][0])
+
+    def test_missing_weights(self):
+        """Test that a model component with a config but no weights is reported."""
+        os.remove(self.path("transformer/diffusion_pytorch_model.safetensors"))
+        result = ltx_video_generator.validate_model_directory(self.model_dir)
+        self.assertFalse(result["valid"])
+        self.assertIn("no weight files", result["problems"][0])
+
+    def test_verdict_is_cached_until_files_change(self):
+        """Test that repeat validations reuse the cached verdict until a file changes."""
+        ltx_video_generator.validate_model_directory(self.model_dir)
+
+        with patch.object(ltx_video_generator, 'validate_component') as mock_validate:
+            result = ltx_video_generator.validate_model_directory(self.model_dir)
+            mock_validate.assert_not_called()
+        self.assertTrue(result["cached"])
+        self.assertTrue(result["valid"])
+
+        write_safetensors(self.path("transformer/diffusion_pytorch_model.safetensors"), 32, truncate_by=4)
+        result = ltx_video_generator.validate_model_directory(self.model_dir)
+        self.assertFalse(result["cached"])
+        self.assertFalse(result["valid"])
+
+
+class FakeSchedule(list):
+    """List standing in for a torch tensor in scheduler sigmas/timesteps."""
+
+    def clone(self):
+        return FakeSchedule(self)
+
+
+class TestDeadlinePlanning(unittest.TestCase):
+    """Test deadline planning and per-host step cost storage."""
+
+    def setUp(self):
+        self.params = {
+            "width": 768, "height": 512, "fps": 24,
+            "duration_seconds": 5, "steps": 40, "guidance_scale": 3.0
+        }
+        self.cost_model = {"step_seconds_per_token": 0.001, "overhead_seconds_per_token": 0.002}
+
+    def test_latent_token_count(self):
+        """Test latent token count for 32x spatial and 8x temporal compression."""
+        self.assertEqual(ltx_video_generator.get_latent_token_count(768, 512, 121), 24 * 16 * 16)
+
+    def test_plan_keeps_parameters_within_budget(self):
+        """Test that a job predicted to fit its budget is left unchanged."""
+        predicted = ltx_video_generator.predict_generation_seconds(self.params, self.cost_model)
+        planned, adjustments = ltx_video_generator.plan_generation_for_deadline(self.params, predicted + 1, self.cost_model)
+        self.assertEqual(planned, self.params)
+        self.assertEqual(adjustments, [])
+
+    def test_plan_reduces_steps_first(self):
+        """Test that steps are reduced before resolution or fps."""
+        predicted = ltx_video_generator.predict_generation_seconds(self.params, self.cost_model)
+        planned, adjustments = ltx_video_generator.plan_generation_for_deadline(self.params, predicted * 0.6, self.cost_model)
+        self.assertLess(planned["steps"], 40)
+        self.assertGreaterEqual(planned["steps"], ltx_video_generator.MIN_DEADLINE_STEPS)
+        self.assertEqual((planned["width"], planned["height"], planned["fps"]), (768, 512, 24))
+        self.assertLessEqual(ltx_video_generator.predict_generation_seconds(planned, self.cost_model), predicted * 0.6)
+        self.assertEqual(len(adjustments), 1)
+
+    def test_plan_reduces_resolution_when_steps_are_not_enough(self):
+        """Test that resolution is reduced in multiples of 32 once steps hit the minimum."""
+        predicted = ltx_video_generator.predict_generation_seconds(self.params, self.cost_model)
+        planned, _ = ltx_video_generator.plan_generation_for_deadline(self.params, predicted * 0.1, self.cost_model)
+        self.assertEqual(planned["steps"], ltx_video_generator.MIN_DEADLINE_STEPS)
+        self.assertLess(planned["width"], 768)
+        self.assertEqual(planned["width"] % 32, 0)
+        self.assertEqual(planned["height"] % 32, 0)
+
+    def test_plan_never_enlarges_small_resolution(self):
+        """Test that a request already below the minimum size keeps its resolution."""
+        params = dict(self.params, width=192, height=128)
+        predicted = ltx_video_generator.predict_generation_seconds(params, self.cost_model)
+        planned, adjustments = ltx_video_generator.plan_generation_for_deadline(params, predicted * 0.05, self.cost_model)
+        self.assertEqual((planned["width"], planned["height"]), (192, 128))
+        self.assertFalse(any(adjustment.startswith("resolution") for adjustment in adjustments))
+
+    def test_plan_keeps_aspect_ratio(self):
+        """Test that resolution reduction keeps the aspect ratio and floors the shorter side."""
+        predicted = ltx_video_generator.predict_generation_seconds(self.params, self.cost_model)
+        planned, _ = ltx_video_generator.plan_generation_for_deadline(self.params, predicted * 0.01, self.cost_model)
+        self.assertEqual((planned["width"], planned["height"]), (384, 256))
+
+    def test_select_schedule_indices(self):
+        """Test that resampled schedule indices start at the current step and stay in range."""
+        self.assertEqual(ltx_video_generator.select_schedule_indices(2, 10, 4), [2, 4, 6, 8])
+        self.assertEqual(ltx_video_generator.select_schedule_indices(5, 8, 3), [5, 6, 7])
+
+    def test_record_step_costs_blends_measurements(self):
+        """Test that stored per-host step costs are smoothed across jobs."""
+        with tempfile.TemporaryDirectory() as cache_dir, patch.dict(os.environ, {"LTX_VIDEO_CACHE_DIR": cache_dir}):
+            ltx_video_generator.record_step_costs("host/cpu", 1.0, 2.0)
+            costs = ltx_video_generator.record_step_costs("host/cpu", 3.0, 4.0)
+            self.assertEqual(costs["step_seconds_per_token"], 2.0)
+            self.assertEqual(costs["overhead_seconds_per_token"], 3.0)
+            self.assertEqual(costs["samples"], 2)
+            self.assertEqual(ltx_video_generator.load_step_costs("host/cpu"), costs)
+            self.assertIsNone(ltx_video_generator.load_step_costs("other/cpu"))
+
+
+class TestDeadlineController(unittest.TestCase):
+    """Test in-run schedule compression against a fake scheduler."""
+
+    def run_steps(self, controller, pipe, step_seconds):
+        """
+        Simulate the denoising loop, skipping steps once the pipeline is interrupted.
+
+        step_seconds is either a fixed step time or a list of per-step times.
+        """
+        if not isinstance(step_seconds, list):
+            step_seconds = [step_seconds] * len(pipe.scheduler.timesteps)
+        clock = [0.0]
+        executed = []
+        with patch.object(ltx_video_generator.time, 'monotonic', side_effect=lambda: clock[0]), \
+             patch('builtins.print'):
+            controller.last_time = 0.0
+            for index in range(len(pipe.scheduler.timesteps)):
+                if pipe._interrupt:
+                    continue
+                executed.append(pipe.scheduler.timesteps[index])
+                clock[0] += step_seconds[index]
+                controller(pipe, index, pipe.scheduler.timesteps[index], {})
+        return executed
+
+    def make_pipe(self, steps):
+        pipe = Mock()
+        pipe._interrupt = False
+        pipe.scheduler.timesteps = FakeSchedule(range(steps * 10, 0, -10))
+        pipe.scheduler.sigmas = FakeSchedule([t / 1000 for t in range(steps * 10, 0, -10)] + [0.0])
+        return pipe
+
+    def test_schedule_is_untouched_when_deadline_is_met(self):
+        """Test that no compression happens when steps fit the deadline."""
+        pipe = self.make_pipe(10)
+        controller = ltx_video_generator.DeadlineController(100.0, 10, 13, overhead_estimate=0.0)
+        executed = self.run_steps(controller, pipe, 1.0)
+        self.assertEqual(len(executed), 10)
+        self.assertEqual(controller.adjustments, [])
+
+    def test_schedule_is_compressed_to_fit_deadline(self):
+        """Test that remaining steps are resampled and the loop interrupted to meet the deadline."""
+        pipe = self.make_pipe(20)
+        controller = ltx_video_generator.DeadlineController(10.0, 20, 23, overhead_estimate=0.0)
+        executed = self.run_steps(controller, pipe, 1.0)
+
+        self.assertEqual(controller.steps_completed, 10)
+        self.assertEqual(len(executed), 10)
+        self.assertTrue(controller.adjustments)
+        # The shortened schedule still ends at the terminal sigma and keeps decreasing timesteps
+        self.assertEqual(pipe.scheduler.sigmas[controller.end_index], 0.0)
+        self.assertEqual(executed, sorted(executed, reverse=True))
+        self.assertEqual(executed[0], 200)
+
+    def test_cuda_work_is_synchronized_before_timing(self):
+        """Test that the controller waits for queued device work before each clock reading."""
+        pipe = self.make_pipe(4)
+        synchronize = Mock()
+        controller = ltx_video_generator.DeadlineController(100.0, 4, 7, overhead_estimate=0.0,
+                                                            synchronize=synchronize)
+        with patch('builtins.print'):
+            controller.mark_start()
+        self.run_steps(controller, pipe, 1.0)
+        self.assertEqual(synchronize.call_count, 5)
+
+    def test_slow_first_step_does_not_shorten_schedule(self):
+        """Test that a first step inflated by prompt encoding is not used on its own to compress."""
+        pipe = self.make_pipe(10)
+        controller = ltx_video_generator.DeadlineController(20.0, 10, 13, overhead_estimate=0.0)
+        executed = self.run_steps(controller, pipe, [5.0] + [1.0] * 9)
+        self.assertEqual(len(executed), 10)
+        self.assertEqual(controller.adjustments, [])
+
+
+class TestCostEstimation(unittest.TestCase):
+    """Test the calibrated runtime and memory estimator."""
+
+    def setUp(self):
+        self.request = {
+            "model_path": "/path/to/model", "prompt": "test prompt", "output_path": "/path/to/output.mp4",
+            "duration_seconds": 5, "steps": 30, "guidance_scale": 3.0,
+            "width": 768, "height": 512, "fps": 24
+        }
+        self.calibration = {
+            "device": "Test GPU",
+            "load_seconds": 20.0,
+            "step_intercept_seconds": 0.5,
+            "step_seconds_per_token": 0.0001,
+            "overhead_intercept_seconds": 2.0,
+            "overhead_seconds_per_token": 0.001,
+            "peak_memory_intercept_bytes": 8e9,
+            "peak_memory_bytes_per_token": 1e5,
+        }
+
+    def test_fit_linear(self):
+        """Test least-squares fitting, including the single-point proportional case."""
+        intercept, slope = ltx_video_generator.fit_linear([1, 2, 3], [3, 5, 7])
+        self.assertAlmostEqual(intercept, 1.0)
+        self.assertAlmostEqual(slope, 2.0)
+        self.assertEqual(ltx_video_generator.fit_linear([4], [2]), (0.0, 0.5))
+        self.assertEqual(ltx_video_generator.fit_linear([], []), (0.0, 0.0))
+
+    def test_estimate_from_calibration(self):
+        """Test wall time and peak memory predicted from a host calibration."""
+        estimate = ltx_video_generator.estimate_request(self.request, self.calibration)
+        tokens = 24 * 16 * 15  # 120 frames -> 15 latent frames
+        self.assertEqual(estimate["latent_tokens"], tokens)
+        self.assertEqual(estimate["source"], "calibration")
+        # Guidance above 1.0 doubles the per-step transformer work
+        self.assertAlmostEqual(estimate["denoise_seconds"], round(30 * (0.5 + 0.0001 * tokens * 2), 2))
+        self.assertAlmostEqual(estimate["estimated_seconds"],
+                               round(20.0 + 30 * (0.5 + 0.0001 * tokens * 2) + 2.0 + 0.001 * tokens, 2), places=1)
+        self.assertEqual(estimate["peak_memory_bytes"], int(8e9 + 1e5 * tokens * 2))
+
+    def test_estimate_falls_back_to_step_costs(self):
+        """Test that deadline-mode step costs are used when the host is not calibrated."""
+        step_costs = {"step_seconds_per_token": 0.0001, "overhead_seconds_per_token": 0.001}
+        estimate = ltx_video_generator.estimate_request(self.request, None, step_costs)
+        self.assertEqual(estimate["source"], "step_costs")
+        self.assertIsNone(estimate["peak_memory_bytes"])
+
+    def test_host_step_costs_match_the_device(self):
+        """Test that the step-cost fallback never uses another device's measurements."""
+        with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"LTX_VIDEO_CACHE_DIR": temp_dir}):
+            ltx_video_generator.record_step_costs(ltx_video_generator.get_host_key("cpu"), 1.0, 1.0)
+            ltx_video_generator.record_step_costs(ltx_video_generator.get_host_key("Test GPU"), 0.1, 0.1)
+
+            self.assertEqual(ltx_video_generator.load_host_step_costs("Test GPU")["step_seconds_per_token"], 0.1)
+            self.assertEqual(ltx_video_generator.load_host_step_costs("cpu")["step_seconds_per_token"], 1.0)
+            self.assertIsNone(ltx_video_generator.load_host_step_costs("Other GPU"))
+            # Without torch the device is only known from the calibration
+            self.assertIsNone(ltx_video_generator.load_host_step_costs())
+            ltx_video_generator.save_cache_file(ltx_video_generator.CALIBRATION_FILE,
+                                                {ltx_video_generator.platform.node(): self.calibration})
+            self.assertEqual(ltx_video_generator.load_host_step_costs()["step_seconds_per_token"], 0.1)
+
+    def test_calibration_is_matched_to_the_device(self):
+        """Test that a calibration is only returned for the device it was made on."""
+        with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"LTX_VIDEO_CACHE_DIR": temp_dir}):
+            ltx_video_generator.save_cache_file(ltx_video_generator.CALIBRATION_FILE,
+                                                {ltx_video_generator.platform.node(): self.calibration})
+            self.assertEqual(ltx_video_generator.load_calibration(), self.calibration)
+            self.assertEqual(ltx_video_generator.load_calibration("Test GPU"), self.calibration)
+            self.assertIsNone(ltx_video_generator.load_calibration("cpu"))
+
+    def test_estimate_without_measurements(self):
+        """Test that no estimate is produced for a host with no measurements."""
+        self.assertIsNone(ltx_video_generator.estimate_request(self.request))
+
+    def test_estimate_cli_outputs_json(self):
+        """Test that --estimate prints JSON using the stored calibration."""
+        with tempfile.TemporaryDirectory() as temp_dir, patch.dict(os.environ, {"LTX_VIDEO_CACHE_DIR": temp_dir}):
+            ltx_video_generator.save_cache_file(ltx_video_generator.CALIBRATION_FILE,
+                                                {ltx_video_generator.platform.node(): self.calibration})
+            request_path = os.path.join(temp_dir, "request.json")
+            with open(request_path, 'w', encoding='utf-8') as f:
+                json.dump(self.request, f)
+
+            with patch.object(sys, 'argv', ['ltx_video_generator.py', '--estimate', request_path]), \
+                 patch('builtins.print') as mock_print, \
+                 patch.object(ltx_video_generator, 'check_dependencies') as mock_check:
+                with self.assertRaises(SystemExit) as context:
+                    ltx_video_generator.main()
+
+            self.assertEqual(context.exception.code, 0)
+            mock_check.assert_not_called()
+            output = json.loads(mock_print.call_args[0][0])
+            self.assertEqual(output["source"], "calibration")
+            self.assertIn("estimated_seconds", output)
+
+
+class FakeLatents:
+    """Records the in-place arithmetic partial_schedule applies to latents."""
+
+    def __init__(self):
+        self.operations = []
+
+    def mul_(self, value):
+        self.operations.append(("mul", value))
+        return self
+
+    def add_(self, other, alpha=1.0):
+        self.operations.append(("add", other, alpha))
+        return self
+
+
+class TestDraftAndRefine(unittest.TestCase):
+    """Test draft-then-refine parameter handling and the partial schedule."""
+
+    def setUp(self):
+        self.request = {
+            "model_path": "/path/to/model", "prompt": "test prompt", "output_path": "/out/video.mp4",
+            "duration_seconds": 5, "steps": 40, "guidance_scale": 3.0,
+            "width": 576, "height": 1024, "fps": 24
+        }
+
+    def test_draft_parameters(self):
+        """Test that drafts halve the resolution in multiples of 32 and cap the steps."""
+        self.assertEqual(ltx_video_generator.get_draft_parameters(576, 1024, 40), (288, 512, 10))
+        self.assertEqual(ltx_video_generator.get_draft_parameters(768, 512, 6), (384, 256, 6))
+
+    def test_refine_steps(self):
+        """Test the number of schedule steps a refine pass executes."""
+        self.assertEqual(ltx_video_generator.get_refine_steps(40, 0.4), 16)
+        self.assertEqual(ltx_video_generator.get_refine_steps(40, 0.001), 1)
+        self.assertEqual(ltx_video_generator.get_refine_steps(40, 2.0), 40)
+
+    def test_effective_parameters(self):
+        """Test that draft and refine requests report the parameters they actually run with."""
+        self.assertEqual(ltx_video_generator.get_effective_parameters(self.request)["steps"], 40)
+
+        draft = ltx_video_generator.get_effective_parameters(dict(self.request, draft=True))
+        self.assertEqual((draft["width"], draft["height"], draft["steps"]), (288, 512, 10))
+
+        refine = ltx_video_generator.get_effective_parameters(
+            dict(self.request, refine_from="/out/draft.latents.pt", refine_strength=0.25))
+        self.assertEqual((refine["width"], refine["height"], refine["steps"]), (576, 1024, 10))
+
+    def test_null_refine_strength_uses_default(self):
+        """Test that a null refine_strength (as serialized by the C# host) falls back to the default."""
+        refine = ltx_video_generator.get_effective_parameters(
+            dict(self.request, refine_from="/out/draft.latents.pt", refine_strength=None))
+        self.assertEqual(refine["steps"], ltx_video_generator.get_refine_steps(
+            40, ltx_video_generator.DEFAULT_REFINE_STRENGTH))
+
+    def test_partial_schedule_keeps_set_timesteps_signature(self):
+        """Test that the wrapped set_timesteps still advertises custom sigmas support."""
+        scheduler = FakeFlowMatchScheduler()
+        with ltx_video_generator.partial_schedule(scheduler, 4, FakeLatents(), "noise"):
+            self.assertIn("sigmas", inspect.signature(scheduler.set_timesteps).parameters)
+
+    def test_draft_latents_path(self):
+        """Test that draft latents are saved alongside the preview video."""
+        self.assertEqual(ltx_video_generator.get_draft_latents_path(os.path.join("out", "video.mp4")),
+                         os.path.join("out", "video.latents.pt"))
+
+    def test_load_draft_latents_is_restricted_and_validated(self):
+        """Test that draft latents load with weights_only and are checked for the expected keys."""
+        fake_torch = types.ModuleType("torch")
+        fake_torch.load = Mock(return_value={"latents": "tensor", "width": 288})
+        with tempfile.NamedTemporaryFile(suffix=".latents.pt", delete=False) as f:
+            latents_path = f.name
+        self.addCleanup(os.remove, latents_path)
+
+        with patch.dict(sys.modules, {"torch": fake_torch}):
+            with self.assertRaises(ValueError) as context:
+                ltx_video_generator.load_draft_latents(latents_path)
+            self.assertIn("latent_num_frames", str(context.exception))
+
+            complete = {key: 1 for key in ltx_video_generator.DRAFT_LATENTS_KEYS}
+            fake_torch.load.return_value = complete
+            self.assertEqual(ltx_video_generator.load_draft_latents(latents_path), complete)
+
+        fake_torch.load.assert_called_with(latents_path, map_location='cpu', weights_only=True)
+
+    def test_final_latents_capture_chains_inner_callback(self):
+        """Test that latents are captured while the deadline controller still runs."""
+        inner = Mock(side_effect=lambda pipe, index, t, kwargs: kwargs)
+        capture = ltx_video_generator.FinalLatentsCapture(inner)
+        capture(None, 0, 1000, {"latents": "first"})
+        result = capture(None, 1, 900, {"latents": "last"})
+        self.assertEqual(capture.latents, "last")
+        self.assertEqual(result, {"latents": "last"})
+        self.assertEqual(inner.call_count, 2)
+
+    def test_partial_schedule_keeps_tail_and_renoises(self):
+        """Test that only the schedule tail runs and latents are re-noised to its first sigma."""
+        scheduler = Mock()
+        original_set_timesteps = scheduler.set_timesteps
+
+        def set_timesteps(*args, **kwargs):
+            scheduler.timesteps = FakeSchedule(range(1000, 0, -100))
+            scheduler.sigmas = FakeSchedule([t / 1000 for t in range(1000, 0, -100)] + [0.0])
+        original_set_timesteps.side_effect = set_timesteps
+
+        latents = FakeLatents()
+        with patch('builtins.print'):
+            with ltx_video_generator.partial_schedule(scheduler, 4, latents, "noise"):
+                scheduler.set_timesteps(10)
+
+        self.assertEqual(list(scheduler.timesteps), [400, 300, 200, 100])
+        self.assertEqual(list(scheduler.sigmas), [0.4, 0.3, 0.2, 0.1, 0.0])
+        self.assertEqual(latents.operations[0][0], "mul")
+        self.assertAlmostEqual(latents.operations[0][1], 0.6)
+        self.assertEqual(latents.operations[1], ("add", "noise", 0.4))
+        self.assertIs(scheduler.set_timesteps, original_set_timesteps)
+
+
+class FakeFlowMatchScheduler:
+    """Scheduler with the set_timesteps signature diffusers' retrieve_timesteps inspects."""
+
+    def set_timesteps(self, num_inference_steps=None, device=None, sigmas=None, mu=None, timesteps=None):
+        self.timesteps = FakeSchedule(range(num_inference_steps * 10, 0, -10))
+        self.sigmas = FakeSchedule([t / 1000 for t in range(num_inference_steps * 10, 0, -10)] + [0.0])
+
+
+class FakePipeline:
+    """
+    Stands in for LTXPipeline: builds its schedule the way retrieve_timesteps does, then runs
+    the denoising loop with step-end callbacks and interrupts.
+    """
+
+    def __init__(self):
+        self.scheduler = FakeFlowMatchScheduler()
+        self.calls = []
+        self.executed_steps = 0
+        self._interrupt = False
+
+    def __call__(self, prompt, num_inference_steps, guidance_scale, width, height, num_frames,
+                 latents=None, callback_on_step_end=None):
+        self.calls.append({"num_inference_steps": num_inference_steps, "width": width, "height": height})
+        self._interrupt = False
+        if "sigmas" not in inspect.signature(self.scheduler.set_timesteps).parameters:
+            raise ValueError("The current scheduler class does not support custom sigmas schedules")
+        self.scheduler.set_timesteps(num_inference_steps, sigmas=None)
+        for index, timestep in enumerate(list(self.scheduler.timesteps)):
+            if self._interrupt:
+                continue
+            self.executed_steps += 1
+            if callback_on_step_end:
+                callback_on_step_end(self, index, timestep, {"latents": f"latents-{index}"})
+        return types.SimpleNamespace(frames=[["frame"] * num_frames])
+
+
+class TestGenerateVideoSchedule(unittest.TestCase):
+    """Test the schedule generate_video hands the pipeline for draft, deadline and refine requests."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.request = {
+            "model_path": self.temp_dir.name, "prompt": "test prompt",
+            "output_path": os.path.join(self.temp_dir.name, "out", "video.mp4"),
+            "duration_seconds": 1, "steps": 40, "guidance_scale": 1.0,
+            "width": 512, "height": 512, "fps": 9
+        }
+        self.pipe = FakePipeline()
+
+        fake_torch = types.ModuleType("torch")
+        fake_torch.cuda = Mock()
+        fake_torch.cuda.is_available.return_value = False
+        fake_torch.manual_seed = Mock()
+        fake_diffusers = types.ModuleType("diffusers")
+        fake_diffusers.LTXPipeline = Mock()
+        fake_diffusers.LTXImageToVideoPipeline = Mock()
+        fake_diffusers_utils = types.ModuleType("diffusers.utils")
+        fake_diffusers_utils.export_to_video = self.export_to_video
+
+        patchers = [
+            patch.dict(sys.modules, {"torch": fake_torch, "diffusers": fake_diffusers,
+                                     "diffusers.utils": fake_diffusers_utils}),
+            patch.dict(os.environ, {"LTX_VIDEO_CACHE_DIR": os.path.join(self.temp_dir.name, "cache")}),
+            patch.object(ltx_video_generator, 'resolve_model_path', return_value=(None, self.temp_dir.name)),
+            patch.object(ltx_video_generator, 'load_pipeline', return_value=self.pipe),
+            patch.object(ltx_video_generator, 'save_draft_latents'),
+            patch('builtins.print'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def export_to_video(self, frames, output_path, fps):
+        with open(output_path, 'wb') as f:
+            f.write(b"video")
+
+    def test_plain_request_runs_requested_steps(self):
+        """Test that a plain request runs its full schedule."""
+        result = ltx_video_generator.generate_video(self.request)
+        self.assertEqual(self.pipe.calls[0]["num_inference_steps"], 40)
+        self.assertEqual(self.pipe.executed_steps, 40)
+        self.assertEqual(result["steps"], 40)
+
+    def test_draft_runs_reduced_steps(self):
+        """Test that drafts run the reduced step count at reduced resolution."""
+        result = ltx_video_generator.generate_video(dict(self.request, draft=True))
+        call = self.pipe.calls[0]
+        self.assertEqual(call["num_inference_steps"], ltx_video_generator.DRAFT_MAX_STEPS)
+        self.assertEqual((call["width"], call["height"]), (256, 256))
+        self.assertEqual(self.pipe.executed_steps, ltx_video_generator.DRAFT_MAX_STEPS)
+        self.assertEqual(result["steps"], ltx_video_generator.DRAFT_MAX_STEPS)
+        self.assertIn("draft_latents_path", result)
+
+    def test_deadline_planned_request_runs_planned_schedule(self):
+        """Test that steps cut by deadline planning shorten the schedule itself, not just the loop."""
+        # 512x512 at 9 frames is 16 * 16 * 2 = 512 tokens; 0.01 s/token makes each step 5.12 s
+        ltx_video_generator.record_step_costs(ltx_video_generator.get_host_key("cpu"), 0.01, 0.0)
+        result = ltx_video_generator.generate_video(dict(self.request, deadline_seconds=100))
+
+        planned_steps = self.pipe.calls[0]["num_inference_steps"]
+        self.assertLess(planned_steps, 40)
+        self.assertEqual(self.pipe.executed_steps, planned_steps)
+        self.assertFalse(self.pipe._interrupt)
+        self.assertEqual(result["steps"], planned_steps)
+        # The estimate is made for the planned parameters, not the raw request
+        self.assertEqual(result["estimate"]["steps"], planned_steps)
+
+    def test_calibration_from_another_device_is_ignored(self):
+        """Test that a GPU calibration is not used to estimate a CPU run."""
+        ltx_video_generator.save_cache_file(ltx_video_generator.CALIBRATION_FILE, {
+            ltx_video_generator.platform.node(): {
+                "device": "Test GPU", "load_seconds": 1.0,
+                "step_intercept_seconds": 0.0, "step_seconds_per_token": 0.0001,
+                "overhead_intercept_seconds": 0.0, "overhead_seconds_per_token": 0.0,
+                "peak_memory_intercept_bytes": None, "peak_memory_bytes_per_token": None
+            }
+        })
+        result = ltx_video_generator.generate_video(self.request)
+        self.assertNotIn("estimate", result)
+
+        ltx_video_generator.record_step_costs(ltx_video_generator.get_host_key("cpu"), 0.0001, 0.0)
+        result = ltx_video_generator.generate_video(self.request)
+        self.assertEqual(result["estimate"]["source"], "step_costs")
+
+    def test_refine_runs_schedule_tail(self):
+        """Test that a refine passes the full schedule length and runs only its tail."""
+        draft_state = {
+            "model_path": self.temp_dir.name, "width": 256, "height": 256,
+            "fps": 9, "duration_seconds": 1, "num_frames": 9
+        }
+        latents = FakeLatents()
+        with patch.object(ltx_video_generator, 'load_draft_latents', return_value=draft_state), \
+             patch.object(ltx_video_generator, 'prepare_refine_latents', return_value=(latents, "noise")):
+            result = ltx_video_generator.generate_video(
+                dict(self.request, refine_from="draft.latents.pt", refine_strength=None))
+
+        self.assertEqual(self.pipe.calls[0]["num_inference_steps"], 40)
+        expected_steps = ltx_video_generator.get_refine_steps(40, ltx_video_generator.DEFAULT_REFINE_STRENGTH)
+        self.assertEqual(self.pipe.executed_steps, expected_steps)
+        self.assertEqual(result["steps"], expected_steps)
+        self.assertEqual(latents.operations[0][0], "mul")
+
 if __name__ == '__main__':
     # Create a test suite that runs all our practical tests
     unittest.main(verbosity=2) 
\ No newline at end of file